@@ -16,29 +16,6 @@ function hideElementById(id) {
 document.body.style.overflow = 'hidden';
 
 document.addEventListener("DOMContentLoaded", function() {
-    function updateHeaders() {
-        fetch("/update-header")
-            .then(response => response.text())
-            .then(originalText => {
-                document.getElementById("header-text").innerText = originalText;
-                document.getElementById("header-text-1").innerText = originalText;
-            });
-
-        fetch("/update-translated-header")
-            .then(response => response.text())
-            .then(translatedText => {
-                document.getElementById("translated-header").innerText = translatedText;
-                document.getElementById("translated-header-1").innerText = translatedText;
-            });
-
-        fetch("/update-transcribed-header")
-            .then(response => response.text())
-            .then(transcribedText => {
-                document.getElementById("transcribed-header").innerText = transcribedText;
-                document.getElementById("transcribed-header-1").innerText = transcribedText;
-            });
-    }
-
     // Check for URL parameters
     const params = new URLSearchParams(window.location.search);
     const showOriginal = params.has("showoriginal");
@@ -72,7 +49,61 @@ document.addEventListener("DOMContentLoaded", function() {
         document.body.classList.add("dark-mode");
     }
 
-    setInterval(updateHeaders, 10);
+    let captionVersion = -1;
+
+    function showCaptions(captions) {
+        captionVersion = captions.version;
+        document.getElementById("header-text").innerText = captions.original;
+        document.getElementById("translated-header").innerText = captions.translated;
+        document.getElementById("transcribed-header").innerText = captions.transcribed;
+        document.getElementById("header-text-1").innerText = captions.original;
+        document.getElementById("translated-header-1").innerText = captions.translated;
+        document.getElementById("transcribed-header-1").innerText = captions.transcribed;
+    }
+
+    // The server pushes the captions whenever they change. While the event stream is down, or on
+    // browsers without EventSource, /captions is long-polled instead: each request returns as soon
+    // as the captions are newer than the version already shown.
+    let eventsOpen = false;
+    let polling = false;
+
+    function pollCaptions() {
+        if (polling || eventsOpen) {
+            return;
+        }
+        polling = true;
+        fetch(`/captions?since=${captionVersion}`)
+            .then(response => {
+                if (response.status === 200) {
+                    return response.json().then(showCaptions);
+                }
+                if (response.status !== 304) {
+                    throw new Error(`/captions returned ${response.status}`);
+                }
+            })
+            .then(() => {
+                polling = false;
+                pollCaptions();
+            })
+            .catch(() => {
+                polling = false;
+                setTimeout(pollCaptions, 1000);
+            });
+    }
+
+    if (window.EventSource) {
+        const captionEvents = new EventSource("/caption-events");
+        captionEvents.onmessage = event => {
+            eventsOpen = true;
+            showCaptions(JSON.parse(event.data));
+        };
+        captionEvents.onerror = () => {
+            eventsOpen = false;
+            pollCaptions();
+        };
+    } else {
+        pollCaptions();
+    }
 
     // Update video frame based on URL parameters
     const videoContainer = document.getElementById("video-frame");
@@ -0,0 +1,72 @@
+from modules.imports import *
+
+
+class AdaptiveChunkSizer:
+    """
+    Picks how many stream segments go into one chunk from the measured inference speed.
+
+    A chunk of n segments of d seconds shows up about n * d + inference time after its first word
+    was spoken, so fewer segments means lower latency. But every chunk also costs a roughly fixed
+    amount of inference time, so with too few segments transcription falls behind the stream.
+
+    The sizer starts from the --stream_chunks value and goes below it when the expected latency is
+    over target_latency, and above it when the real-time factor (inference time / audio time)
+    would go over target_rtf. Keeping up with the stream wins when both can't be met. It moves one
+    segment per chunk so a single slow chunk does not swing the size around.
+    """
+
+    def __init__(self, initial, min_segments=1, max_segments=10, target_latency=10.0, target_rtf=0.7, smoothing=0.3):
+        self.min_segments = max(min_segments, 1)
+        self.max_segments = max(max_segments, self.min_segments)
+        self.segments = min(max(initial, self.min_segments), self.max_segments)
+        self.preferred = self.segments
+        self.target_latency = target_latency
+        self.target_rtf = target_rtf
+        self.smoothing = smoothing
+        self.segment_duration = None
+        self.inference_time = None
+        self.rtf = None
+
+    def _average(self, current, value):
+        return value if current is None else current + self.smoothing * (value - current)
+
+    def record_segment(self, duration):
+        """Called for every downloaded segment with its EXTINF duration."""
+        if duration:
+            self.segment_duration = self._average(self.segment_duration, float(duration))
+
+    def record_chunk(self, audio_seconds, inference_seconds):
+        """Called after each chunk is transcribed, returns the segment count for the next chunks."""
+        if not audio_seconds or not self.segment_duration:
+            return self.segments
+        self.inference_time = self._average(self.inference_time, inference_seconds)
+        self.rtf = self._average(self.rtf, inference_seconds / audio_seconds)
+
+        # Smallest chunk that keeps up with the stream, and largest that stays under the latency target.
+        keep_up = math.ceil(self.inference_time / (self.target_rtf * self.segment_duration))
+        in_budget = math.floor((self.target_latency - self.inference_time) / self.segment_duration)
+        wanted = max(keep_up, min(self.preferred, in_budget))
+        wanted = min(max(wanted, self.min_segments), self.max_segments)
+
+        previous = self.segments
+        if wanted > self.segments:
+            self.segments += 1
+        elif wanted < self.segments:
+            self.segments -= 1
+        if self.segments != previous:
+            print(f"Stream chunks: {previous} -> {self.segments} segments ({self.report()})")
+        return self.segments
+
+    def expected_latency(self):
+        if not self.segment_duration or self.inference_time is None:
+            return None
+        return self.segments * self.segment_duration + self.inference_time
+
+    def report(self):
+        if self.rtf is None:
+            return f"{self.segments} segments per chunk, no measurements yet"
+        return (f"RTF {self.rtf:.2f}, inference {self.inference_time:.1f}s per chunk, "
+                f"{self.segment_duration:.1f}s segments, ~{self.expected_latency():.1f}s latency")
+
+
+print("Adaptive Chunks Module Loaded")
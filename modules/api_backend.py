@@ -1,27 +1,180 @@
 import os
+import json
 import logging
-from flask import Flask, send_from_directory, url_for
-from threading import Thread
+import mimetypes
+from threading import Thread, Condition, Lock
 import ssl
+from modules.caption_store import CaptionStore
+from modules.live_subtitles import LiveSubtitleTrack
+from urllib.parse import quote
 
 header_text = ""
 translated_header_text = ""
 transcribed_header_text = ""
+caption_delay = 0.0
+# Latest output of every stream in multi-stream mode, by stream name
+stream_headers = {}
+# Goes up by one every time a caption changes, /caption-events waits on caption_changed for it.
+caption_version = 0
+caption_changed = Condition()
+# Recent captions for /captions/history, resized by set_caption_history()
+caption_history = CaptionStore()
+
+def captions_changed():
+    global caption_version
+    with caption_changed:
+        caption_version += 1
+        caption_changed.notify_all()
+
+def captions():
+    return {"version": caption_version, "original": header_text,
+            "translated": translated_header_text, "transcribed": transcribed_header_text}
+
+def caption_event():
+    """The current captions as one server-sent event."""
+    current = captions()
+    return f"id: {current['version']}\ndata: {json.dumps(current)}\n\n"
+
+def wait_for_captions(since, timeout):
+    """Blocks until the caption version is no longer since or timeout seconds passed."""
+    with caption_changed:
+        return caption_changed.wait_for(lambda: caption_version != since, timeout=timeout)
+
+# HLS subtitle tracks by (stream name or None, kind), made when the first caption of that kind arrives
+subtitle_tracks = {}
+subtitle_settings = {"segment_duration": 6.0, "window": 10}
+SUBTITLE_KINDS = ("original", "translated", "transcribed")
+
+def set_subtitle_settings(segment_duration, window):
+    subtitle_settings.update(segment_duration=segment_duration, window=window)
+
+def subtitle_track(kind, stream_name=None):
+    track = subtitle_tracks.get((stream_name, kind))
+    if track is None:
+        prefix = f"/streams/{quote(stream_name, safe='')}" if stream_name else ""
+        track = subtitle_tracks.setdefault((stream_name, kind), LiveSubtitleTrack(f"{prefix}/subs/{kind}/", **subtitle_settings))
+    return track
+
+def set_caption_history(capacity):
+    global caption_history
+    caption_history = CaptionStore(capacity)
+
+def add_caption(original, translated="", transcribed="", language=None, stream_name=None, revise_last=False):
+    """Adds a caption to the history, see CaptionStore.add()."""
+    return caption_history.add(original or "", translated or "", transcribed or "", language, stream_name, revise_last)
+
+def publish_phrase(original, translated, transcribed, language=None, revise_last=False):
+    """Shows the captions of one microphone tick and adds (or with revise_last, updates) their history entry."""
+    update_header(original)
+    update_translated_header(translated)
+    update_transcribed_header(transcribed)
+    return add_caption(original, translated, transcribed, language, revise_last=revise_last)
 
 def update_header(new_header):
     global header_text
-    header_text = new_header
+    if new_header != header_text:
+        header_text = new_header
+        captions_changed()
+        subtitle_track("original").add(new_header)
 
 def update_translated_header(new_header):
     global translated_header_text
-    translated_header_text = new_header
+    if new_header != translated_header_text:
+        translated_header_text = new_header
+        captions_changed()
+        subtitle_track("translated").add(new_header)
 
 def update_transcribed_header(new_header):
     global transcribed_header_text
-    transcribed_header_text = new_header
+    if new_header != transcribed_header_text:
+        transcribed_header_text = new_header
+        captions_changed()
+        subtitle_track("transcribed").add(new_header)
+
+def update_caption_delay(delay):
+    global caption_delay
+    caption_delay = delay
+
+def update_stream_header(stream_name, kind, value):
+    """kind is "original", "translated", "transcribed" or "caption_delay"."""
+    headers = stream_headers.setdefault(stream_name, {"original": "", "translated": "", "transcribed": "", "caption_delay": 0.0})
+    if headers[kind] != value:
+        headers[kind] = value
+        if kind != "caption_delay":
+            captions_changed()
+            subtitle_track(kind, stream_name).add(value)
+
+# Pages and static files by path: (mtime, size, content)
+file_cache = {}
+file_cache_lock = Lock()
+
+def cached_file(path):
+    """
+    Returns (content, etag) of a file, read from disk only the first time and after it changed.
+    Raises OSError if the file does not exist.
+    """
+    stat = os.stat(path)
+    with file_cache_lock:
+        cached = file_cache.get(path)
+    if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+        with open(path, 'rb') as file:
+            cached = (stat.st_mtime_ns, stat.st_size, file.read())
+        with file_cache_lock:
+            file_cache[path] = cached
+    return cached[2], f"{cached[0]:x}-{cached[1]:x}"
+
+def overlay_certificate(cert_dir="certs"):
+    """
+    Self-signed certificate for --web_https. It is kept in cert_dir and reused on later starts,
+    a new one is only made when there is none or it expired.
+    """
+    from OpenSSL import crypto
+
+    cert_file = os.path.join(cert_dir, 'overlay_cert.pem')
+    key_file = os.path.join(cert_dir, 'overlay_key.pem')
+    if os.path.exists(cert_file) and os.path.exists(key_file):
+        try:
+            with open(cert_file, 'rb') as certfile:
+                if not crypto.load_certificate(crypto.FILETYPE_PEM, certfile.read()).has_expired():
+                    return cert_file, key_file
+        except crypto.Error:
+            pass
+
+    print("Generating a self-signed certificate for the web server...")
+    # Create a key pair
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 2048)
+
+    # Create a self-signed cert
+    cert = crypto.X509()
+    cert.get_subject().CN = 'localhost'
+    cert.set_serial_number(int.from_bytes(os.urandom(8), 'big'))
+    cert.gmtime_adj_notBefore(0)
+    cert.gmtime_adj_notAfter(365 * 24 * 60 * 60)
+    cert.set_issuer(cert.get_subject())
+    cert.set_pubkey(key)
+    cert.sign(key, 'sha256')
+
+    os.makedirs(cert_dir, exist_ok=True)
+    with open(cert_file, 'wb') as certfile:
+        certfile.write(crypto.dump_certificate(crypto.FILETYPE_PEM, cert))
+    # Only readable by the user running the server
+    with open(os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as keyfile:
+        keyfile.write(crypto.dump_privatekey(crypto.FILETYPE_PEM, key))
+    return cert_file, key_file
 
-def flask_server(operation, portnumber):
+def flask_server(operation, portnumber, server="production", threads=200, https=False):
+    """
+    Starts the web server in a new thread.
+
+    server "production" runs the app on cheroot's thread pool (threads workers) when cheroot is
+    installed and on werkzeug's threaded server otherwise, "dev" uses Flask's development server.
+    """
     if operation == "start":
+        # Flask is only imported once the web server is actually started.
+        from flask import Flask, Response, request, url_for, jsonify, abort
+        from werkzeug.security import safe_join
+
         # Define paths
         script_dir = os.path.dirname(os.path.realpath(__file__))
         project_root = os.path.dirname(script_dir)
@@ -29,7 +182,8 @@ def flask_server(operation, portnumber):
         static_dir = os.path.join(html_data_dir, 'static')
 
         # Flask server
-        app = Flask(__name__, static_folder=static_dir, static_url_path='/static')
+        # Static files are served from memory by serve_static() below.
+        app = Flask(__name__, static_folder=None)
         app.config["DEBUG"] = False
 
         # Set the logging level to WARNING
@@ -50,23 +204,27 @@ def flask_server(operation, portnumber):
         # Set the root directory
         @app.route('/')
         def serve_index():
-            index_html_path = os.path.join(html_data_dir, 'index.html')
-            with open(index_html_path, 'r') as file:
-                html_content = file.read()
-                updated_html = html_content.replace("{{ header_text }}", header_text)
-            return updated_html
+            html_content, _ = cached_file(os.path.join(html_data_dir, 'index.html'))
+            return html_content.decode('utf-8').replace("{{ header_text }}", header_text)
 
         @app.route('/player.html')
         def serve_player():
-            player_html_path = os.path.join(html_data_dir, 'player.html')
-            with open(player_html_path, 'r') as file:
-                player_html_content = file.read()
-            return player_html_content
+            player_html_content, _ = cached_file(os.path.join(html_data_dir, 'player.html'))
+            return player_html_content.decode('utf-8')
 
-        # Serve static files (CSS, JS, images)
-        @app.route('/static/<path:filename>')
+        # Serve static files (CSS, JS, images) from memory, revalidated with their ETag
+        @app.route('/static/<path:filename>', endpoint='static')
         def serve_static(filename):
-            return send_from_directory(static_dir, filename)
+            path = safe_join(static_dir, filename)
+            if path is None or not os.path.isfile(path):
+                abort(404)
+            content, etag = cached_file(path)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = Response(content, mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+            response.set_etag(etag)
+            return response
 
         # Route for updating the header dynamically
         @app.route('/update-header')
@@ -83,6 +241,106 @@ def flask_server(operation, portnumber):
         def update_transcribed_header_route():
             return transcribed_header_text
 
+        # All three captions with their version. Answers If-None-Match with 304, and with
+        # ?since=<version> waits until the captions are newer than that (up to ?timeout= seconds).
+        @app.route('/captions')
+        def captions_route():
+            since = request.args.get('since', type=int)
+            if since is not None:
+                timeout = min(max(request.args.get('timeout', 25.0, type=float), 0.0), 60.0)
+                wait_for_captions(since, timeout)
+            current = captions()
+            version = str(current["version"])
+            if request.if_none_match.contains(version) or current["version"] == since:
+                response = Response(status=304)
+            else:
+                response = jsonify(current)
+            response.set_etag(version)
+            return response
+
+        # Caption history, ?after=<id> returns the entries newer than that id (oldest first), without
+        # it the newest ones. ?limit= is the most entries returned, 100 by default and 1000 at most.
+        @app.route('/captions/history')
+        def caption_history_route():
+            after = request.args.get('after', type=int)
+            limit = min(max(request.args.get('limit', 100, type=int), 0), 1000)
+            return jsonify(caption_history.page(after, limit))
+
+        # Live subtitle tracks for video players: an HLS playlist of WebVTT segments per kind of
+        # caption (original, translated, transcribed), /subs.m3u8 is the original text.
+        def subtitle_response(kind, stream_name=None, sequence=None):
+            if kind not in SUBTITLE_KINDS or (stream_name is not None and stream_name not in stream_headers):
+                abort(404)
+            track = subtitle_track(kind, stream_name)
+            if sequence is None:
+                response = Response(track.get_playlist(), mimetype='application/vnd.apple.mpegurl')
+            else:
+                segment = track.get_segment(sequence)
+                if segment is None:
+                    abort(404)
+                response = Response(segment, mimetype='text/vtt')
+            # Players on other sites load the track next to the stream.
+            response.headers['Access-Control-Allow-Origin'] = '*'
+            return response
+
+        @app.route('/subs.m3u8')
+        def subtitle_playlist_route():
+            return subtitle_response("original")
+
+        @app.route('/subs/<kind>.m3u8')
+        def subtitle_kind_playlist_route(kind):
+            return subtitle_response(kind)
+
+        @app.route('/subs/<kind>/<int:sequence>.vtt')
+        def subtitle_segment_route(kind, sequence):
+            return subtitle_response(kind, sequence=sequence)
+
+        @app.route('/streams/<stream_name>/subs/<kind>.m3u8')
+        def stream_subtitle_playlist_route(stream_name, kind):
+            return subtitle_response(kind, stream_name)
+
+        @app.route('/streams/<stream_name>/subs/<kind>/<int:sequence>.vtt')
+        def stream_subtitle_segment_route(stream_name, kind, sequence):
+            return subtitle_response(kind, stream_name, sequence)
+
+        # Pushes the captions to the overlays whenever they change instead of them polling the three
+        # routes above. A comment line is sent every 15 seconds so proxies keep the connection open.
+        @app.route('/caption-events')
+        def caption_events_route():
+            def events():
+                version = caption_version
+                yield caption_event()
+                while True:
+                    with caption_changed:
+                        caption_changed.wait_for(lambda: caption_version != version, timeout=15)
+                    if caption_version == version:
+                        yield ": keepalive\n\n"
+                        continue
+                    version = caption_version
+                    yield caption_event()
+
+            return Response(events(), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+        # Seconds between a stream chunk being queued and its captions being shown
+        @app.route('/caption-delay')
+        def caption_delay_route():
+            return f"{caption_delay:.2f}"
+
+        # Latest output of every stream in multi-stream mode
+        @app.route('/streams')
+        def streams_route():
+            return jsonify(stream_headers)
+
+        # One stream's original, translated or transcribed text, or its caption delay
+        @app.route('/streams/<stream_name>/<kind>')
+        def stream_header_route(stream_name, kind):
+            headers = stream_headers.get(stream_name)
+            if headers is None or kind not in headers:
+                abort(404)
+            value = headers[kind]
+            return f"{value:.2f}" if kind == "caption_delay" else value
+
         # Generate URL for static file in index.html
         @app.context_processor
         def override_url_for():
@@ -110,46 +368,40 @@ def flask_server(operation, portnumber):
         # Function to run the server
         def run(use_https=False):
             try:
+                context = None
                 if use_https:
-                    from OpenSSL import crypto
-
-                    # Create a key pair
-                    key = crypto.PKey()
-                    key.generate_key(crypto.TYPE_RSA, 2048)
-
-                    # Create a self-signed cert
-                    cert = crypto.X509()
-                    cert.get_subject().CN = 'localhost'
-                    cert.set_serial_number(1000)
-                    cert.gmtime_adj_notBefore(0)
-                    cert.gmtime_adj_notAfter(365 * 24 * 60 * 60)
-                    cert.set_issuer(cert.get_subject())
-                    cert.set_pubkey(key)
-                    cert.sign(key, 'sha256')
-
-                    # Write cert and key to temporary files
-                    cert_file = 'temp_cert.pem'
-                    key_file = 'temp_key.pem'
-                    with open(cert_file, 'wb') as certfile:
-                        certfile.write(crypto.dump_certificate(crypto.FILETYPE_PEM, cert))
-                    with open(key_file, 'wb') as keyfile:
-                        keyfile.write(crypto.dump_privatekey(crypto.FILETYPE_PEM, key))
-
-                    context = ssl.SSLContext(ssl.PROTOCOL_TLSv1_2)
+                    cert_file, key_file = overlay_certificate()
+                    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
                     context.load_cert_chain(certfile=cert_file, keyfile=key_file)
+
+                if server == "dev":
                     app.run(host='0.0.0.0', port=port, ssl_context=context)
+                    return
 
-                    # Remove temporary cert and key files
-                    os.remove(cert_file)
-                    os.remove(key_file)
-                else:
-                    app.run(host='0.0.0.0', port=port)
+                try:
+                    from cheroot import wsgi
+                except ImportError:
+                    wsgi = None
+                if wsgi is None:
+                    from werkzeug.serving import make_server
+                    print("cheroot is not installed, using werkzeug's threaded server. Install cheroot for a production server.")
+                    make_server('0.0.0.0', port, app, threaded=True, ssl_context=context).serve_forever()
+                    return
+
+                # Every open overlay holds one thread for its event stream.
+                httpd = wsgi.Server(('0.0.0.0', port), app, numthreads=threads, request_queue_size=128,
+                                    server_name='Synthalingua')
+                if use_https:
+                    from cheroot.ssl.builtin import BuiltinSSLAdapter
+                    httpd.ssl_adapter = BuiltinSSLAdapter(cert_file, key_file)
+                print(f"Web server running on cheroot with {threads} threads.")
+                httpd.start()
             except Exception as e:
                 print(f"Server crashed due to {e}")
                 app.do_teardown_appcontext()
 
         # Start the server in a new thread
-        Thread(target=run).start()
+        Thread(target=run, args=(https,)).start()
 
 def kill_server():
     print("Killing Server")
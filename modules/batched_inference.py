@@ -0,0 +1,80 @@
+from modules.imports import *
+from modules.multitask_inference import EncodedChunk, detect_languages, decode_batch
+
+
+class InferenceJob:
+    """
+    One chunk of audio waiting for transcription, with what to do with it.
+
+    tasks is the list of (task, language) decodes the chunk needs, language None means the detected
+    language. on_done(job, chunk) is called with the EncodedChunk once they are done (chunk is None
+    if inference failed), its transcribe() calls for those tasks return the batched results.
+    context holds whatever the caller needs back in on_done.
+    """
+
+    def __init__(self, audio, model, tasks, on_done, fp16=False, condition_on_previous_text=False,
+                 audio_ctx=False, audio_ctx_bucket=2.0, context=None):
+        self.audio = audio
+        self.model = model
+        self.tasks = tasks
+        self.on_done = on_done
+        self.fp16 = fp16
+        self.condition_on_previous_text = condition_on_previous_text
+        self.audio_ctx = audio_ctx
+        self.audio_ctx_bucket = audio_ctx_bucket
+        self.context = context or {}
+        self.inference_seconds = 0.0
+
+
+batch_stats = {"batches": 0, "chunks": 0, "seconds": 0.0}
+
+
+def run_jobs(jobs):
+    """
+    Runs a batch of jobs: one encoder pass, one language detection pass and one decoder pass per
+    task and language for all jobs that share a model and settings, then hands every job its chunk.
+    """
+    groups = {}
+    for job in jobs:
+        key = (id(job.model), job.fp16, job.condition_on_previous_text, job.audio_ctx, job.audio_ctx_bucket)
+        groups.setdefault(key, []).append(job)
+
+    for group in groups.values():
+        first = group[0]
+        start = time.perf_counter()
+        try:
+            chunks = EncodedChunk.encode_batch(first.model, [job.audio for job in group], fp16=first.fp16,
+                                               condition_on_previous_text=first.condition_on_previous_text,
+                                               audio_ctx=first.audio_ctx, audio_ctx_bucket=first.audio_ctx_bucket)
+            if any(language is None for job in group for _, language in job.tasks):
+                detect_languages(chunks)
+            decode_batch([(chunk, task, language) for job, chunk in zip(group, chunks) for task, language in job.tasks])
+        except Exception as e:
+            print(f"Error transcribing audio: {e}")
+            chunks = [None] * len(group)
+        elapsed = time.perf_counter() - start
+
+        # Each job is charged its share of the batch by audio length.
+        total_audio = sum(len(job.audio) for job in group) or 1
+        for job in group:
+            job.inference_seconds = elapsed * len(job.audio) / total_audio
+        batch_stats["batches"] += 1
+        batch_stats["chunks"] += len(group)
+        batch_stats["seconds"] += elapsed
+
+        for job, chunk in zip(group, chunks):
+            try:
+                job.on_done(job, chunk)
+            except Exception as e:
+                print(f"Error handling transcription: {e}")
+
+
+def batch_report():
+    batches = batch_stats["batches"]
+    if not batches:
+        return "Batched inference: no batches yet"
+    return (f"Batched inference: {batch_stats['chunks']} chunks in {batches} batches "
+            f"(average batch {batch_stats['chunks'] / batches:.1f}, {batch_stats['seconds'] / batches:.2f}s per batch)")
+
+
+print("Batched Inference Module Loaded")
@@ -0,0 +1,60 @@
+import time
+from threading import Lock
+
+
+class CaptionStore:
+    """
+    Fixed-size history of the captions for scrollback overlays and viewers that join late.
+
+    Entries get increasing ids and are kept in a ring buffer of capacity entries, so once it is
+    full every new entry overwrites the oldest one and memory stays the same however long the
+    session runs. The newest entry can be revised while its phrase is still being spoken
+    (microphone mode), its revision goes up every time.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = max(capacity, 1)
+        self.entries = [None] * self.capacity
+        self.next_id = 0
+        self.lock = Lock()
+
+    def add(self, original="", translated="", transcribed="", language=None, stream=None, revise_last=False):
+        """Stores a caption and returns its id. With revise_last the newest entry of the same stream is updated instead."""
+        with self.lock:
+            if revise_last and self.next_id:
+                entry = self.entries[(self.next_id - 1) % self.capacity]
+                if entry["stream"] == stream:
+                    entry.update(original=original, translated=translated, transcribed=transcribed, language=language,
+                                 revision=entry["revision"] + 1)
+                    return entry["id"]
+
+            entry = {"id": self.next_id, "time": time.time(), "stream": stream, "language": language,
+                     "original": original, "translated": translated, "transcribed": transcribed, "revision": 0}
+            self.entries[self.next_id % self.capacity] = entry
+            self.next_id += 1
+            return entry["id"]
+
+    def page(self, after=None, limit=100):
+        """
+        Returns the entries with an id above after, oldest first and at most limit of them, or the
+        newest limit entries without after. missed counts the entries after `after` that were
+        already overwritten before they were asked for.
+        """
+        with self.lock:
+            oldest = max(self.next_id - self.capacity, 0)
+            limit = max(limit, 0)
+            if after is None:
+                start = max(self.next_id - limit, oldest)
+                missed = 0
+            else:
+                start = max(after + 1, oldest)
+                missed = max(oldest - (after + 1), 0)
+            end = min(start + limit, self.next_id)
+            entries = [dict(self.entries[i % self.capacity]) for i in range(start, end)]
+        return {"entries": entries, "oldest": oldest, "latest": self.next_id - 1, "missed": missed}
+
+    def __len__(self):
+        return min(self.next_id, self.capacity)
+
+
+print("Caption Store Module Loaded")
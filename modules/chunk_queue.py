@@ -0,0 +1,133 @@
+from modules.imports import *
+from collections import deque
+
+OVERLOAD_POLICIES = ("drop_oldest", "merge", "degrade")
+
+
+class LatencyBoundedQueue:
+    """
+    Queue between the stream downloader and the transcription thread that stays near real time.
+
+    At most max_size chunks wait at once. What happens when transcription can't keep up depends
+    on the policy:
+      drop_oldest - the oldest chunk is thrown away, and chunks that waited longer than
+                    latency_budget seconds are skipped, the newest one is always kept
+      merge       - queued chunks are merged into one so they are transcribed in a single pass
+      degrade     - overloaded is set so the caller can switch to a faster model, the oldest
+                    chunk is still dropped if the queue is full
+
+    Every chunk is stamped with the time it was queued, get() returns that with the chunk so the
+    caller can measure the caption delay.
+    """
+
+    def __init__(self, max_size=4, latency_budget=60.0, policy="drop_oldest", merge=None, discard=None):
+        if policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy: {policy}")
+        self.max_size = max(max_size, 1)
+        self.latency_budget = latency_budget
+        self.policy = policy
+        self.merge = merge
+        self.discard = discard
+        self.items = deque()
+        self.closed = False
+        # Called after every put() and close(), lets one thread wait on several queues.
+        self.on_change = None
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.merged = 0
+
+    def _drop_oldest(self, reason):
+        _, item = self.items.popleft()
+        self.dropped += 1
+        print(f"Stream transcription is falling behind, skipped a chunk ({reason}).")
+        if self.discard:
+            self.discard(item)
+
+    def _merge_oldest(self):
+        (queued_at, first), (_, second) = self.items.popleft(), self.items.popleft()
+        self.items.appendleft((queued_at, self.merge(first, second)))
+        self.merged += 1
+
+    def put(self, item):
+        with self.condition:
+            self.items.append((time.monotonic(), item))
+            while len(self.items) > self.max_size:
+                if self.policy == "merge" and self.merge:
+                    self._merge_oldest()
+                else:
+                    self._drop_oldest("queue full")
+            self.condition.notify()
+        if self.on_change:
+            self.on_change()
+
+    def get(self, block=True):
+        """
+        Returns the next (chunk, queued_at). Blocks until there is one unless block is False,
+        returns None when nothing is queued and the queue is closed (or block is False).
+        """
+        with self.condition:
+            while block and not self.items and not self.closed:
+                self.condition.wait()
+            if not self.items:
+                return None
+
+            if self.policy == "drop_oldest" and self.latency_budget:
+                now = time.monotonic()
+                while len(self.items) > 1 and now - self.items[0][0] > self.latency_budget:
+                    self._drop_oldest("older than the latency budget")
+            elif self.policy == "merge" and self.merge:
+                while len(self.items) > 1:
+                    self._merge_oldest()
+
+            queued_at, item = self.items.popleft()
+            return item, queued_at
+
+    @property
+    def depth(self):
+        return len(self.items)
+
+    @property
+    def overloaded(self):
+        """True while chunks are piling up or the oldest one waited longer than the latency budget."""
+        with self.condition:
+            if len(self.items) >= self.max_size:
+                return True
+            if self.latency_budget and self.items:
+                return time.monotonic() - self.items[0][0] > self.latency_budget
+            return False
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.on_change:
+            self.on_change()
+
+
+class CaptionDelay:
+    """Tracks the time from a chunk being queued to its captions being shown."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+
+    def record(self, queued_at):
+        delay = time.monotonic() - queued_at
+        self.count += 1
+        self.total += delay
+        self.last = delay
+        self.max = max(self.max, delay)
+        return delay
+
+    def report(self, chunk_queue=None):
+        average = self.total / self.count if self.count else 0.0
+        text = f"Caption delay: last {self.last:.1f}s, average {average:.1f}s, max {self.max:.1f}s"
+        if chunk_queue is not None:
+            text += (f" | queue {chunk_queue.depth}/{chunk_queue.max_size} ({chunk_queue.policy}), "
+                     f"{chunk_queue.dropped} chunks skipped, {chunk_queue.merged} merged")
+        return text
+
+
+print("Chunk Queue Module Loaded")
@@ -0,0 +1,75 @@
+from modules.imports import *
+from modules.sliding_window import normalize_word
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 320  # 20 ms frames
+
+
+def quietest_cut(audio, search_seconds):
+    """Sample index at the start of the quietest 20 ms frame within the last search_seconds of audio."""
+    search = min(int(search_seconds * SAMPLE_RATE), len(audio))
+    n_frames = search // FRAME_LENGTH
+    if n_frames == 0:
+        return len(audio)
+    offset = len(audio) - n_frames * FRAME_LENGTH
+    frames = audio[offset:].reshape(n_frames, FRAME_LENGTH)
+    energy = np.mean(frames ** 2, axis=1)
+    return offset + int(np.argmin(energy)) * FRAME_LENGTH
+
+
+class SeamAligner:
+    """
+    Moves the boundaries between stream chunks to quiet points so words are not cut in half.
+
+    Instead of ending a chunk where the last HLS segment happens to end, the chunk is cut at the
+    quietest point of its last search_window seconds and the audio after the cut is carried over
+    to the start of the next chunk. With overlap set, the next chunk also repeats the last overlap
+    seconds before the cut, and words transcribed twice because of that are removed from the start
+    of the next output by dedupe().
+    """
+
+    def __init__(self, search_window=1.0, overlap=0.0, max_overlap_words=8):
+        self.search_window = search_window
+        self.overlap = overlap
+        self.max_overlap_words = max_overlap_words
+        self.carry = np.zeros(0, dtype=np.float32)
+        self.previous_words = {}
+        self.deduped_words = 0
+
+    def align(self, audio):
+        """Returns the part of carry + audio to transcribe now, the rest is kept for the next chunk."""
+        audio = np.concatenate((self.carry, audio))
+        if len(audio) < 2 * self.search_window * SAMPLE_RATE:
+            # Too short to move the cut, transcribe it all.
+            self.carry = np.zeros(0, dtype=np.float32)
+            return audio
+
+        cut = quietest_cut(audio, self.search_window)
+        self.carry = audio[max(cut - int(self.overlap * SAMPLE_RATE), 0):]
+        return audio[:cut]
+
+    def dedupe(self, name, text):
+        """Drops the words at the start of text that repeat the end of the previous text of the same output."""
+        words = text.split()
+        previous = self.previous_words.get(name, [])
+        repeated = 0
+        if self.overlap:
+            for k in range(min(len(previous), len(words), self.max_overlap_words), 0, -1):
+                tail = [normalize_word(word) for word in previous[-k:]]
+                if tail == [normalize_word(word) for word in words[:k]]:
+                    # A single short word ("a", "you") repeats by chance too often to drop it.
+                    if k > 1 or len(tail[0]) >= 4:
+                        repeated = k
+                    break
+        words = words[repeated:]
+        self.deduped_words += repeated
+        if words:
+            self.previous_words[name] = (previous + words)[-self.max_overlap_words:]
+        return " ".join(words) if repeated else text
+
+    def report(self):
+        return (f"Chunk seams: cut within the last {self.search_window:g}s, {self.overlap:g}s overlap, "
+                f"{self.deduped_words} repeated words removed")
+
+
+print("Chunk Seams Module Loaded")
@@ -0,0 +1,112 @@
+from modules.imports import *
+
+
+def physical_cores():
+    """
+    The cores this process may run on, as one list of logical CPUs per physical core.
+
+    Hyperthread siblings are read from /sys on Linux. Where the topology can't be read every
+    logical CPU counts as its own core.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+
+    cores = {}
+    for cpu in cpus:
+        try:
+            topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+            with open(f"{topology}/physical_package_id") as package, open(f"{topology}/core_id") as core:
+                key = (package.read().strip(), core.read().strip())
+        except OSError:
+            key = cpu
+        cores.setdefault(key, []).append(cpu)
+    return list(cores.values())
+
+
+def configure_cpu_threads(threads=0):
+    """
+    Sets the torch thread pools for CPU inference.
+
+    Intra-op threads default to one per physical core, which is faster for whisper than letting
+    hyperthreads fight over the same core. Inter-op threads are kept small since whisper runs one
+    operator at a time.
+    """
+    cores = physical_cores()
+    logical = sum(len(core) for core in cores)
+    if not threads:
+        threads = len(cores)
+    interop = max(1, min(4, logical // threads))
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(interop)
+    except RuntimeError:
+        # Can only be set before torch runs any parallel work.
+        interop = torch.get_num_interop_threads()
+    print(f"CPU threads: {threads} intra-op, {interop} inter-op ({len(cores)} physical, {logical} logical cores available)")
+    return threads
+
+
+def quantize_int8(model):
+    """Applies dynamic int8 quantization to every Linear layer of a whisper model."""
+    # whisper's Linear subclass only adds a dtype cast for fp16, quantize_dynamic only swaps
+    # plain nn.Linear layers, so turn them back into those first.
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def time_encoder(model, runs=2):
+    """Best-of-n time of one full 30 second encoder pass."""
+    mel = torch.zeros(1, model.dims.n_mels, whisper.audio.N_FRAMES)
+    best = None
+    with torch.no_grad():
+        for _ in range(runs):
+            start = time.perf_counter()
+            model.embed_audio(mel)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def load_int8_model(name, download_root):
+    """
+    Loads a whisper model with int8 Linear layers for CPU inference.
+
+    The quantized state_dict is cached in download_root next to the original checkpoint and read
+    back with weights_only, so a file in the model folder can't run code when it is loaded. The speedup is
+    measured and printed when converting. A cache that doesn't fit the model anymore, after a
+    torch or whisper update, is converted again.
+    """
+    cache_path = os.path.join(download_root, f"{name}-int8.pt")
+    model = whisper.load_model(name, device="cpu", download_root=download_root)
+    if os.path.exists(cache_path):
+        try:
+            state_dict = torch.load(cache_path, map_location="cpu", weights_only=True)
+            model = quantize_int8(model)
+            model.load_state_dict(state_dict)
+            model.eval()
+            print(f"Loaded cached int8 weights from {cache_path}")
+            return model
+        except Exception as e:
+            print(f"Could not load the cached int8 weights, converting again: {e}")
+            model = whisper.load_model(name, device="cpu", download_root=download_root)
+
+    print(f"Quantizing {name} to int8...")
+    fp32_time = time_encoder(model)
+    model = quantize_int8(model)
+    int8_time = time_encoder(model)
+    print(f"int8 encoder pass: {int8_time * 1000:.0f} ms vs {fp32_time * 1000:.0f} ms in fp32 ({fp32_time / int8_time:.2f}x speedup)")
+
+    try:
+        torch.save(model.state_dict(), cache_path)
+        print(f"Saved int8 weights to {cache_path}")
+    except Exception as e:
+        print(f"Could not save int8 weights: {e}")
+    return model
+
+
+print("CPU Inference Module Loaded")
@@ -0,0 +1,59 @@
+from modules.imports import *
+from functools import lru_cache
+
+DEFAULT_TIMEOUT = (5, 15)
+
+
+@lru_cache(maxsize=None)
+def timeout_adapter():
+    """
+    HTTPAdapter that applies a default timeout to every request sent through it.
+
+    Built on first use so importing this module does not import requests.
+    """
+    class TimeoutHTTPAdapter(requests.adapters.HTTPAdapter):
+        def __init__(self, timeout=DEFAULT_TIMEOUT, **kwargs):
+            self.timeout = timeout
+            super().__init__(**kwargs)
+
+        def send(self, request, **kwargs):
+            if kwargs.get("timeout") is None:
+                kwargs["timeout"] = self.timeout
+            return super().send(request, **kwargs)
+
+    return TimeoutHTTPAdapter
+
+
+def create_session(pool_size=10, timeout=DEFAULT_TIMEOUT, cookies=None, params=None, max_retries=0):
+    """
+    Creates a requests.Session that keeps connections alive and reuses them between requests.
+
+    pool_size is the number of connections kept open per host, it should be at least the number
+    of threads sharing the session. cookies (any cookie jar) and params are sent with every request.
+    """
+    session = requests.Session()
+    adapter = timeout_adapter()(timeout=timeout, pool_connections=pool_size, pool_maxsize=pool_size,
+                                max_retries=max_retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if cookies is not None:
+        session.cookies.update(cookies)
+    if params:
+        session.params.update(params)
+    return session
+
+
+shared_session_lock = threading.Lock()
+shared_session_instance = None
+
+
+def shared_session():
+    """Session shared by the small one-off requests (Discord webhook, update check)."""
+    global shared_session_instance
+    with shared_session_lock:
+        if shared_session_instance is None:
+            shared_session_instance = create_session(pool_size=4)
+        return shared_session_instance
+
+
+print("HTTP Client Module Loaded")
@@ -1,20 +1,18 @@
 ##### Primary Imports #####
 try:
+    import time
+    startup_time = time.perf_counter()
+
     import argparse
+    import importlib
     import io
     import os
-    import speech_recognition as sr
-    import whisper
-    import torch
     import math
     import sys
     import ctypes
     import shutil
-    import numpy as np
-    import requests
     import json
     import re
-    import flask
     try:
         # if the os is not windows then skip this
         if os.name == 'nt':
@@ -22,9 +20,6 @@ try:
             win32api.SetDllDirectory(sys._MEIPASS)
     except:
         pass
-    import pytz
-    import pyaudio
-    import humanize
 
     from datetime import datetime, timedelta
     from queue import Queue
@@ -32,18 +27,11 @@ try:
     from time import sleep
     from sys import platform
     from colorama import Fore, Back, Style, init
-    from tqdm import tqdm
-    from numba import cuda
     from prettytable import PrettyTable
-    from dateutil.tz import tzlocal
-    from tzlocal import get_localzone
-    from whisper.utils import get_writer
 
     import subprocess
     import threading
     import queue
-    import time
-    import m3u8
     import hashlib
     import http.cookiejar
 
@@ -54,11 +42,68 @@ except Exception as e:
     sys.exit(1)
 
 
+##### Lazy Imports #####
+# Heavy dependencies are only imported the first time something uses them, so commands like
+# --about or --list_microphones don't pay for torch/whisper/flask before doing anything.
+
+import_times = {}
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            start = time.perf_counter()
+            try:
+                self._module = importlib.import_module(self._name)
+            except Exception as e:
+                print(f"Error Loading {self._name}")
+                print("Check to make sure you have all the required modules installed.")
+                print("Error: " + str(e))
+                sys.exit(1)
+            import_times[self._name] = time.perf_counter() - start
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+sr = LazyModule("speech_recognition")
+whisper = LazyModule("whisper")
+torch = LazyModule("torch")
+np = LazyModule("numpy")
+requests = LazyModule("requests")
+flask = LazyModule("flask")
+pytz = LazyModule("pytz")
+pyaudio = LazyModule("pyaudio")
+humanize = LazyModule("humanize")
+m3u8 = LazyModule("m3u8")
+cuda = LazyModule("numba.cuda")
+
+
+def print_startup_report(stage):
+    """Prints how long startup took so far and what each lazily imported module cost (--startup_profile)."""
+    print(f"Startup profile ({stage}): {time.perf_counter() - startup_time:.3f}s since launch")
+    for name, seconds in sorted(import_times.items(), key=lambda item: item[1], reverse=True):
+        print(f"  import {name:<20} {seconds:.3f}s")
+    if not import_times:
+        print("  no heavy modules imported")
+
 
 ##### Extensions #####
 
 print("Loading Extensions")
 try:
+    from modules.http_client import create_session, shared_session
     from modules.version_checker import check_for_updates
     #from modules.model_downloader import fine_tune_model_dl, fine_tune_model_dl_compressed
     from modules.discord import send_to_discord_webhook
@@ -67,7 +112,9 @@ try:
     from modules import parser_args
     from modules.languages import get_valid_languages
     from modules import api_backend
-    from modules.stream_transcription_module import start_stream_transcription, stop_transcription
+    from modules.text_filter import IgnoreListFilter
+    # The inference, stream and worker modules are imported where transcribe_audio.py uses them,
+    # so a mode only loads what it runs.
     from modules.sub_gen import run_sub_gen
     #from modules import microphone_check
 except Exception as e:
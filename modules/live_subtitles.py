@@ -0,0 +1,119 @@
+import math
+import time
+from collections import deque
+from datetime import datetime, timezone
+from threading import Lock
+
+
+def vtt_timestamp(seconds):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+
+def vtt_text(text):
+    # Cue text can't contain blank lines or markup characters.
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    return "\n".join(lines).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+class LiveSubtitleTrack:
+    """
+    Rolling HLS subtitle track (an .m3u8 playlist of short WebVTT segments) built from the captions.
+
+    Every caption becomes a cue that starts when the caption was published and lasts until the
+    next one replaces it, at most max_cue seconds. The track's timeline is cut into segments of
+    segment_duration seconds, a segment is rendered once when its time is over and only the last
+    window segments are kept, all in memory. The playlist is rebuilt only when a segment is added,
+    requests just return the stored text.
+
+    Cue times count from when the track was created (X-TIMESTAMP-MAP LOCAL 0 is MPEGTS 0), not
+    from the source stream's timestamps, so next to the source the cues are late by the caption delay.
+    """
+
+    def __init__(self, base_url, segment_duration=6.0, window=10, max_cue=10.0):
+        self.base_url = base_url
+        self.segment_duration = max(segment_duration, 1.0)
+        self.window = max(window, 1)
+        self.max_cue = max_cue
+        self.start = time.time()
+        self.next_sequence = 0
+        # (sequence, wall clock start, vtt text) of the segments in the window
+        self.segments = deque(maxlen=self.window)
+        # [start, end, text] with times relative to self.start, end is None while the cue is showing
+        self.cues = []
+        self.playlist = self._render_playlist()
+        self.lock = Lock()
+
+    def add(self, text, now=None):
+        """Shows text from now on, an empty text only ends the current cue."""
+        now = time.time() if now is None else now
+        with self.lock:
+            self._roll(now)
+            offset = now - self.start
+            if self.cues and self.cues[-1][1] is None:
+                self.cues[-1][1] = offset
+            if text and text.strip():
+                self.cues.append([offset, None, text])
+
+    def _cue_end(self, cue):
+        end = cue[0] + self.max_cue
+        return end if cue[1] is None else min(cue[1], end)
+
+    def _roll(self, now):
+        """Renders every segment whose time is over."""
+        elapsed = now - self.start
+        completed = int(elapsed // self.segment_duration)
+        if completed <= self.next_sequence:
+            return
+        # Only the last window segments can still be listed, older ones are skipped without rendering.
+        self.next_sequence = max(self.next_sequence, completed - self.window)
+        while self.next_sequence < completed:
+            self.segments.append((self.next_sequence, self.start + self.next_sequence * self.segment_duration,
+                                  self._render_segment(self.next_sequence)))
+            self.next_sequence += 1
+        segment_end = completed * self.segment_duration
+        self.cues = [cue for cue in self.cues if self._cue_end(cue) > segment_end]
+        self.playlist = self._render_playlist()
+
+    def _render_segment(self, sequence):
+        segment_start = sequence * self.segment_duration
+        segment_end = segment_start + self.segment_duration
+        lines = ["WEBVTT", "X-TIMESTAMP-MAP=MPEGTS:0,LOCAL:00:00:00.000", ""]
+        for cue in self.cues:
+            # Cues that span several segments are repeated in each of them, cut to the segment.
+            start, end = max(cue[0], segment_start), min(self._cue_end(cue), segment_end)
+            if start < end:
+                lines += [f"{vtt_timestamp(start)} --> {vtt_timestamp(end)}", vtt_text(cue[2]), ""]
+        return "\n".join(lines)
+
+    def _render_playlist(self):
+        first = self.segments[0][0] if self.segments else self.next_sequence
+        # Every segment lasts segment_duration, the target duration may not be below any #EXTINF.
+        target_duration = math.ceil(self.segment_duration)
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{target_duration}",
+                 f"#EXT-X-MEDIA-SEQUENCE:{first}"]
+        for sequence, wall_start, _ in self.segments:
+            program_time = datetime.fromtimestamp(wall_start, timezone.utc).isoformat(timespec="milliseconds")
+            lines += [f"#EXT-X-PROGRAM-DATE-TIME:{program_time}", f"#EXTINF:{self.segment_duration:.3f},",
+                      f"{self.base_url}{sequence}.vtt"]
+        return "\n".join(lines) + "\n"
+
+    def get_playlist(self):
+        with self.lock:
+            self._roll(time.time())
+            return self.playlist
+
+    def get_segment(self, sequence):
+        """The WebVTT text of a segment, or None if it is not in the window (anymore)."""
+        with self.lock:
+            self._roll(time.time())
+            for segment_sequence, _, text in self.segments:
+                if segment_sequence == sequence:
+                    return text
+        return None
+
+
+print("Live Subtitles Module Loaded")
@@ -0,0 +1,123 @@
+from modules.imports import *
+from collections import OrderedDict
+from modules.cpu_inference import load_int8_model
+
+
+def model_size_mb(model):
+    """Memory taken by the weights and buffers of a model in MB."""
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors) / 1024 / 1024
+
+
+class ModelManager:
+    """
+    Bounded LRU pool of loaded whisper models for --auto_model_swap.
+
+    Models are loaded in a background thread with preload(), so transcription keeps running on the
+    current model while the next one loads. switch_to() marks a model as wanted and current() swaps
+    to it as soon as it is ready. Models that were used before stay in memory, up to max_models
+    and memory_budget_mb, so flipping back to a language does not load the model from disk again.
+    """
+
+    def __init__(self, device, download_root, max_models=2, memory_budget_mb=0, int8=False):
+        self.device = device
+        self.int8 = int8
+        self.download_root = download_root
+        self.max_models = max(max_models, 1)
+        self.memory_budget_mb = memory_budget_mb
+        self.models = OrderedDict()
+        self.loading = {}
+        self.lock = threading.Lock()
+        self.current_name = None
+        self.pending_name = None
+
+    def add(self, name, model):
+        """Registers an already loaded model and makes it the current one."""
+        with self.lock:
+            self.models[name] = model
+            self.current_name = name
+
+    def _load(self, name):
+        try:
+            start = time.perf_counter()
+            if self.int8:
+                model = load_int8_model(name, self.download_root)
+            else:
+                model = whisper.load_model(name, device=self.device, download_root=self.download_root)
+            print(f"Model {name} loaded in the background in {time.perf_counter() - start:.1f}s.")
+        except Exception as e:
+            print(f"Failed to load model {name}: {e}")
+            model = None
+
+        with self.lock:
+            del self.loading[name]
+            if model is None:
+                if self.pending_name == name:
+                    self.pending_name = None
+                return
+            self.models[name] = model
+            self._evict()
+
+    def preload(self, name):
+        """Starts loading a model in the background unless it is loaded or already loading."""
+        with self.lock:
+            if name in self.models:
+                self.models.move_to_end(name)
+                return
+            if name in self.loading:
+                return
+            thread = threading.Thread(target=self._load, args=(name,), daemon=True)
+            self.loading[name] = thread
+        thread.start()
+
+    def switch_to(self, name):
+        """Swaps to the model as soon as it is loaded, the current one keeps working until then."""
+        self.preload(name)
+        with self.lock:
+            self.pending_name = name if name != self.current_name else None
+
+    def get(self, name):
+        """
+        Returns the model if it is loaded, otherwise starts loading it and returns None. Unlike
+        switch_to() it leaves the current model alone, for callers that share the pool.
+        """
+        with self.lock:
+            if name in self.models:
+                self.models.move_to_end(name)
+                return self.models[name]
+        self.preload(name)
+        return None
+
+    def current(self):
+        """Returns the (name, model) to use for the next chunk."""
+        with self.lock:
+            if self.pending_name in self.models:
+                self.current_name = self.pending_name
+                self.pending_name = None
+                print(f"Model was changed to {self.current_name}.")
+                self._evict()
+            self.models.move_to_end(self.current_name)
+            return self.current_name, self.models[self.current_name]
+
+    def _evict(self):
+        # Never drops the current model or the one waiting to be swapped in.
+        keep = {self.current_name, self.pending_name}
+
+        def over_budget():
+            if len(self.models) > self.max_models:
+                return True
+            if self.memory_budget_mb:
+                return sum(model_size_mb(model) for model in self.models.values()) > self.memory_budget_mb
+            return False
+
+        while over_budget():
+            victim = next((name for name in self.models if name not in keep), None)
+            if victim is None:
+                break
+            del self.models[victim]
+            print(f"Unloaded model {victim} from the model pool.")
+            if self.device.type == "cuda":
+                torch.cuda.empty_cache()
+
+
+print("Model Manager Module Loaded")
@@ -0,0 +1,309 @@
+from modules.imports import *
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+# Same fallback settings whisper.transcribe() uses, so results match the calls this replaces.
+TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+# Encoder positions per second of audio (1500 positions for 30 seconds).
+AUDIO_CTX_PER_SECOND = 50
+# Extra audio kept after the end of a chunk so the last word is not cut off by the bucket edge.
+AUDIO_CTX_MARGIN = 0.5
+
+
+@lru_cache(maxsize=None)
+def cached_features_decoding_task():
+    """
+    DecodingTask that takes already encoded audio features of any context length.
+
+    Built on first use so importing this module does not import whisper.
+    """
+    class CachedFeaturesDecodingTask(whisper.decoding.DecodingTask):
+        def _get_audio_features(self, mel):
+            return mel
+
+    return CachedFeaturesDecodingTask
+
+
+def audio_ctx_for(n_samples, bucket):
+    """Encoder context for a chunk, rounded up to a whole number of bucket seconds and capped at 30 s."""
+    seconds = n_samples / whisper.audio.SAMPLE_RATE + AUDIO_CTX_MARGIN
+    seconds = math.ceil(seconds / bucket) * bucket
+    return min(int(seconds * AUDIO_CTX_PER_SECOND), AUDIO_CTX_PER_SECOND * whisper.audio.CHUNK_LENGTH)
+
+
+def encode(model, mel):
+    """
+    model.encoder() that accepts shorter mel spectrograms, like audio_ctx in whisper.cpp.
+
+    The positional embedding is trimmed to the length of the input instead of asserting that the
+    input is a full 30 second window.
+    """
+    encoder = model.encoder
+    x = torch.nn.functional.gelu(encoder.conv1(mel))
+    x = torch.nn.functional.gelu(encoder.conv2(x))
+    x = x.permute(0, 2, 1)
+    x = (x + encoder.positional_embedding[: x.shape[1]]).to(x.dtype)
+    for block in encoder.blocks:
+        x = block(x)
+    return encoder.ln_post(x)
+
+
+def detect_language_from_features(model, features):
+    """whisper.detect_language() for encoder output of any context length."""
+    tokenizer = whisper.tokenizer.get_tokenizer(model.is_multilingual, num_languages=model.num_languages)
+    tokens = torch.tensor([[tokenizer.sot]] * features.shape[0]).to(features.device)
+    logits = model.logits(tokens, features)[:, 0]
+
+    mask = torch.ones(logits.shape[-1], dtype=torch.bool)
+    mask[list(tokenizer.all_language_tokens)] = False
+    logits[:, mask] = -np.inf
+    probs = logits.softmax(dim=-1).cpu()
+    return [
+        {code: probs[i, token].item() for token, code in zip(tokenizer.all_language_tokens, tokenizer.all_language_codes)}
+        for i in range(features.shape[0])
+    ]
+
+
+def decode_features(model, features, task, language, fp16=False, temperatures=TEMPERATURES, prompt=None):
+    """
+    Decodes a batch of encoder outputs with the temperature fallback of whisper.transcribe().
+    Only the items that fail the thresholds are decoded again at the next temperature.
+    """
+    results = [None] * features.shape[0]
+    pending = list(range(features.shape[0]))
+    for temperature in temperatures:
+        options = whisper.DecodingOptions(task=task, language=language, temperature=temperature,
+                                          fp16=fp16, without_timestamps=True, prompt=prompt)
+        decoded = cached_features_decoding_task()(model, options).run(features[pending])
+
+        retry = []
+        for index, result in zip(pending, decoded):
+            results[index] = result
+            if result.no_speech_prob > NO_SPEECH_THRESHOLD:
+                continue
+            if result.compression_ratio <= COMPRESSION_RATIO_THRESHOLD and result.avg_logprob >= LOGPROB_THRESHOLD:
+                continue
+            retry.append(index)
+        pending = retry
+        if not pending:
+            break
+    return results
+
+
+class FeaturesModel:
+    """
+    Stands in for a model in whisper.timing.find_alignment(), which calls model(mel, tokens), so
+    the decoder runs on encoder output that was already computed instead of encoding again.
+    """
+
+    def __init__(self, model):
+        self._model = model
+
+    def __call__(self, features, tokens):
+        return self._model.decoder(tokens, features)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+def word_timings(model, features, tokens, language, n_samples):
+    """(start, end, word) of every word of decoded text tokens, aligned on the chunk's encoder output."""
+    tokenizer = whisper.tokenizer.get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                                                language=language, task="transcribe")
+    tokens = [token for token in tokens if token < tokenizer.eot]
+    alignment = whisper.timing.find_alignment(FeaturesModel(model), tokenizer, tokens, features[0],
+                                              n_samples // whisper.audio.HOP_LENGTH)
+    # Same punctuation handling as word_timestamps=True in whisper.transcribe()
+    whisper.timing.merge_punctuations(alignment, "\"'“¿([{-", "\"'.。,，!！?？:：”)]}、")
+    return [(float(timing.start), float(timing.end), timing.word) for timing in alignment if timing.word]
+
+
+def result_text(result, language):
+    # Same silence check whisper.transcribe() does before it keeps a segment.
+    if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob <= LOGPROB_THRESHOLD:
+        return {"text": "", "language": language}
+    return {"text": result.text, "language": language}
+
+
+class EncodedChunk:
+    """
+    One chunk of 16 kHz audio with its log-mel spectrogram and encoder output computed once.
+
+    Original-language transcription, English translation and target-language transcription all
+    decode from the cached encoder output instead of each paying for the mel + encoder pass again.
+    Chunks longer than whisper's 30 second window fall back to model.transcribe().
+
+    With audio_ctx set the encoder input is sized to the chunk (rounded up to audio_ctx_bucket
+    seconds) instead of padding every chunk to 30 seconds.
+
+    encode_batch() builds the chunks of several clips with one batched encoder pass.
+    """
+
+    def __init__(self, model, audio, fp16=False, condition_on_previous_text=False, audio_ctx=False, audio_ctx_bucket=2.0,
+                 features=None):
+        self.model = model
+        self.audio = audio
+        self.fp16 = fp16 and model.device.type == "cuda"
+        self.condition_on_previous_text = condition_on_previous_text
+        self.language = None
+        self.language_probs = None
+        self.features = features
+        # Decodes done ahead of time by decode_batch(), by (task, language)
+        self.results = {}
+
+        if features is None and len(audio) <= whisper.audio.N_SAMPLES:
+            if audio_ctx:
+                n_frames = audio_ctx_for(len(audio), audio_ctx_bucket) * 2
+            else:
+                n_frames = whisper.audio.N_FRAMES
+            padded = whisper.pad_or_trim(audio, n_frames * whisper.audio.HOP_LENGTH)
+            mel = whisper.log_mel_spectrogram(padded, n_mels=model.dims.n_mels).to(model.device)
+            if self.fp16:
+                mel = mel.half()
+            with torch.no_grad():
+                self.features = encode(model, mel.unsqueeze(0))
+
+    @classmethod
+    def encode_batch(cls, model, audios, fp16=False, condition_on_previous_text=False, audio_ctx=False, audio_ctx_bucket=2.0):
+        """
+        Returns an EncodedChunk for every clip, with the encoder run once for all clips that fit in
+        whisper's 30 second window. With audio_ctx the batch is sized to its longest clip.
+        """
+        fits = [len(audio) <= whisper.audio.N_SAMPLES for audio in audios]
+        if audio_ctx:
+            n_frames = max((audio_ctx_for(len(audio), audio_ctx_bucket) * 2 for audio, fit in zip(audios, fits) if fit), default=0)
+        else:
+            n_frames = whisper.audio.N_FRAMES
+
+        features = [None] * len(audios)
+        if any(fits):
+            mels = [whisper.log_mel_spectrogram(whisper.pad_or_trim(audio, n_frames * whisper.audio.HOP_LENGTH), n_mels=model.dims.n_mels)
+                    for audio, fit in zip(audios, fits) if fit]
+            mel = torch.stack(mels).to(model.device)
+            if fp16 and model.device.type == "cuda":
+                mel = mel.half()
+            with torch.no_grad():
+                encoded = iter(encode(model, mel))
+            features = [next(encoded).unsqueeze(0) if fit else None for fit in fits]
+
+        # Clips over 30 seconds are left without features and fall back to model.transcribe().
+        return [cls(model, audio, fp16=fp16, condition_on_previous_text=condition_on_previous_text, features=feature)
+                for audio, feature in zip(audios, features)]
+
+    def detect_language(self):
+        """Returns the detected language code and the probabilities for every language."""
+        if self.language is None:
+            if self.features is not None:
+                with torch.no_grad():
+                    self.language_probs = detect_language_from_features(self.model, self.features)[0]
+            else:
+                mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(self.audio), n_mels=self.model.dims.n_mels)
+                _, language_probs = self.model.detect_language(mel.to(self.model.device).unsqueeze(0))
+                self.language_probs = language_probs[0]
+            self.language = max(self.language_probs, key=self.language_probs.get)
+        return self.language, self.language_probs
+
+    def transcribe(self, task="transcribe", language=None, retry=False):
+        """
+        Decodes the chunk for the given task. Returns a dict with "text" like model.transcribe().
+
+        If no language is given the detected one is used. With retry set, decoding starts from the
+        first fallback temperature since a second greedy pass would give the same result.
+        """
+        if language is None:
+            language, _ = self.detect_language()
+        if not retry and (task, language) in self.results:
+            return self.results[(task, language)]
+
+        if self.features is None:
+            return self.model.transcribe(self.audio, task=task, language=language, fp16=self.fp16,
+                                         condition_on_previous_text=self.condition_on_previous_text)
+
+        temperatures = TEMPERATURES[1:] if retry else TEMPERATURES
+        result = decode_features(self.model, self.features, task, language, self.fp16, temperatures)[0]
+        return result_text(result, language)
+
+
+def detect_languages(chunks):
+    """detect_language() for several chunks of the same model with one batched decoder pass."""
+    pending = [chunk for chunk in chunks if chunk.language is None and chunk.features is not None]
+    groups = {}
+    for chunk in pending:
+        groups.setdefault(tuple(chunk.features.shape), []).append(chunk)
+    for group in groups.values():
+        with torch.no_grad():
+            probs = detect_language_from_features(group[0].model, torch.cat([chunk.features for chunk in group]))
+        for chunk, language_probs in zip(group, probs):
+            chunk.language_probs = language_probs
+            chunk.language = max(language_probs, key=language_probs.get)
+    for chunk in chunks:
+        chunk.detect_language()
+
+
+def decode_batch(requests):
+    """
+    Runs the (chunk, task, language) decodes of several chunks of the same model as batches, one
+    per task and language. The results are cached on the chunks, so their transcribe() calls for
+    the same task and language return right away. language None means the detected language.
+    """
+    groups = {}
+    for chunk, task, language in requests:
+        if language is None:
+            language, _ = chunk.detect_language()
+        if chunk.features is None or (task, language) in chunk.results:
+            continue
+        groups.setdefault((task, language, tuple(chunk.features.shape)), []).append(chunk)
+
+    for (task, language, _), group in groups.items():
+        group = list({id(chunk): chunk for chunk in group}.values())
+        first = group[0]
+        results = decode_features(first.model, torch.cat([chunk.features for chunk in group]), task, language, first.fp16)
+        for chunk, result in zip(group, results):
+            chunk.results[(task, language)] = result_text(result, language)
+
+
+audio_ctx_stats = {"chunks": 0, "padded_time": 0.0, "reduced_time": 0.0, "similarity": 0.0}
+
+
+def compare_audio_ctx(model, audio, language=None, fp16=False, audio_ctx_bucket=2.0):
+    """
+    Transcribes a chunk with the padded 30 second encoder input and with the reduced audio context,
+    then prints the latency of both and how closely the reduced output matches the padded one.
+    """
+    results = {}
+    for name, reduced in (("padded", False), ("reduced", True)):
+        if model.device.type == "cuda":
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        chunk = EncodedChunk(model, audio, fp16=fp16, audio_ctx=reduced, audio_ctx_bucket=audio_ctx_bucket)
+        text = chunk.transcribe(language=language)["text"]
+        if model.device.type == "cuda":
+            torch.cuda.synchronize()
+        results[name] = (time.perf_counter() - start, text)
+
+    padded_time, padded_text = results["padded"]
+    reduced_time, reduced_text = results["reduced"]
+    similarity = SequenceMatcher(None, padded_text.lower().split(), reduced_text.lower().split()).ratio()
+
+    audio_ctx_stats["chunks"] += 1
+    audio_ctx_stats["padded_time"] += padded_time
+    audio_ctx_stats["reduced_time"] += reduced_time
+    audio_ctx_stats["similarity"] += similarity
+    chunks = audio_ctx_stats["chunks"]
+
+    print(f"Audio context comparison ({len(audio) / whisper.audio.SAMPLE_RATE:.1f}s chunk, "
+          f"ctx {audio_ctx_for(len(audio), audio_ctx_bucket)}/{model.dims.n_audio_ctx}):")
+    print(f"  padded:  {padded_time * 1000:.0f} ms  {padded_text}")
+    print(f"  reduced: {reduced_time * 1000:.0f} ms  {reduced_text}")
+    print(f"  word match {similarity * 100:.1f}% | average over {chunks} chunks: "
+          f"padded {audio_ctx_stats['padded_time'] / chunks * 1000:.0f} ms, "
+          f"reduced {audio_ctx_stats['reduced_time'] / chunks * 1000:.0f} ms, "
+          f"word match {audio_ctx_stats['similarity'] / chunks * 100:.1f}%")
+    return results
+
+
+print("Multitask Inference Module Loaded")
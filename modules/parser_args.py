@@ -64,7 +64,14 @@ def set_model_by_ram(ram, language):
     return model
 
 
+parsed_args = None
+
+
 def parse_arguments():
+    # Arguments are parsed once, later calls get the same namespace back.
+    global parsed_args
+    if parsed_args is not None:
+        return parsed_args
     parser = argparse.ArgumentParser()
     parser.add_argument("--ram", default="4gb", help="Model to use", choices=["1gb", "2gb", "4gb", "6gb", "12gb-v2", "12gb-v3"])
     parser.add_argument("--ramforce", action='store_true', help="Force the model to use the RAM setting provided. Warning: This may cause the model to crash.")
@@ -74,6 +81,15 @@ def parse_arguments():
     parser.add_argument("--record_timeout", default=1, help="How real time the recording is in seconds.", type=float)
     parser.add_argument("--phrase_timeout", default=5, help="How much empty space between recordings before we "
                              "consider it a new line in the transcription.", type=float)
+    parser.add_argument("--sliding_window", action='store_true', help="Commit text that two transcriptions in a row agree on and only re-transcribe the rest of the phrase. Keeps long phrases from slowing down.")
+    parser.add_argument("--sliding_window_max", default=15, help="Longest uncommitted audio in seconds kept by --sliding_window before it is committed anyway.", type=float)
+    parser.add_argument("--audio_ctx", action='store_true', help="Size the encoder input to the length of each chunk instead of padding every chunk to 30 seconds. Much faster for short chunks, may be slightly less accurate.")
+    parser.add_argument("--audio_ctx_bucket", default=2.0, help="Round the encoder input of --audio_ctx up to a multiple of this many seconds.", type=float)
+    parser.add_argument("--audio_ctx_compare", action='store_true', help="Run every chunk through both the padded and the --audio_ctx encoder and print latency and how closely the text matches.")
+    parser.add_argument("--vad", action='store_true', help="Skip audio without speech in it (silence, noise, background music) before it reaches the model.")
+    parser.add_argument("--vad_energy", default=-45.0, help="Loudness in dBFS a 30 ms frame needs to count as speech for --vad.", type=float)
+    parser.add_argument("--vad_flatness", default=0.45, help="Highest spectral flatness (0 = tonal, 1 = white noise) a frame can have to count as speech for --vad.", type=float)
+    parser.add_argument("--vad_min_speech", default=0.3, help="Seconds of speech a chunk needs before --vad lets it through.", type=float)
     parser.add_argument("--no_log", action='store_true', help="Only show the last line of the transcription.")
     parser.add_argument("--debug", action='store_true', help="Debug things")
     parser.add_argument("--translate", action='store_true', help="Translate the transcriptions to English.")
@@ -81,7 +97,11 @@ def parse_arguments():
     parser.add_argument("--language", help="Language to translate from.", type=str, choices=VALID_LANGUAGES)
     parser.add_argument("--target_language", help="Language to translate to.", type=str, choices=VALID_LANGUAGES)
     parser.add_argument("--auto_model_swap", action='store_true', help="Automatically swap model based on detected language.")
+    parser.add_argument("--model_pool_size", default=2, help="How many models --auto_model_swap keeps loaded at once.", type=int)
+    parser.add_argument("--model_pool_memory", default=0, help="Memory budget in MB for the models --auto_model_swap keeps loaded. 0 means only --model_pool_size limits it.", type=int)
     parser.add_argument("--device", default="cuda", help="Device to use for model. If not specified, will use CUDA if available. Available options: cpu, cuda")
+    parser.add_argument("--int8", action='store_true', help="CPU only: quantize the model's linear layers to int8. Much faster on CPU with a small accuracy cost. The quantized model is cached in --model_dir.")
+    parser.add_argument("--cpu_threads", default=0, help="Threads torch uses for CPU inference. 0 picks one per physical core.", type=int)
     parser.add_argument("--cuda_device", default=0, help="CUDA device to use for model. If not specified, will use CUDA device 0.", type=int)
     parser.add_argument("--discord_webhook", default=None, help="Discord webhook to send transcription to.", type=str)
     parser.add_argument("--list_microphones", action='store_true', help="List available microphones and exit.")
@@ -95,16 +115,43 @@ def parse_arguments():
     parser.add_argument("--keep_temp", action='store_true', help="Keep temporary audio files.")
     parser.add_argument(
     "--portnumber", default=None, help="Port number to run the web server on. If not specified, the web server will not run.", type=valid_port_number)
+    parser.add_argument("--caption_history", default=1000, help="How many captions the web server keeps for /captions/history. Default is 1000.", type=int)
+    parser.add_argument("--subtitle_segment_duration", default=6.0, help="Seconds per WebVTT segment of the live subtitle playlists (/subs.m3u8). Default is 6.", type=float)
+    parser.add_argument("--subtitle_window", default=10, help="How many WebVTT segments the live subtitle playlists list. Default is 10.", type=int)
+    parser.add_argument("--web_server", default="production", choices=["production", "dev"], help="Server the web server runs on. production uses cheroot (werkzeug's threaded server if cheroot is not installed), dev uses Flask's development server. Default is production.")
+    parser.add_argument("--web_threads", default=200, help="Worker threads of the production web server. Every open caption overlay holds one. Default is 200.", type=int)
+    parser.add_argument("--web_https", action='store_true', help="Serve the web server over HTTPS with a self-signed certificate that is kept in the certs folder.")
     parser.add_argument("--about", action='store_true', help="About the project.")
+    parser.add_argument("--startup_profile", action='store_true', help="Print how long startup took and how long each heavy module took to import.")
     parser.add_argument("--save_transcript", action='store_true', help="Save the transcript to a file.")
     parser.add_argument("--save_folder", default="out", help="Folder to save the transcript to.")
     parser.add_argument("--stream", default=None, help="Stream mode. Specify the url to the stream. Example: https://twitch.tv/laplusdarknesss_hololive")
+    parser.add_argument("--streams", nargs="+", default=None, help="Multi-stream mode. Caption several streams at once with one shared model. Example: --streams https://twitch.tv/channel1 https://twitch.tv/channel2")
+    parser.add_argument("--streams_file", default=None, help="Text file with the streams for multi-stream mode, one url or \"name url\" per line.")
     parser.add_argument("--stream_original_text", action='store_true', help="Show's the detected language of the stream.")
     parser.add_argument("--stream_chunks", default=5, help="How many chunks to split the stream into. Default is 5 is recommended to be between 3 and 5. YouTube streams should be 1 or 2, twitch should be 5 to 10.", type=int)
     parser.add_argument("--stream_language", default=None, help="Language of the stream. Default is English.", type=str, choices=VALID_LANGUAGES)
     parser.add_argument("--stream_target_language", default=None, help="Language to translate the stream to. Default is English.", type=str, choices=VALID_LANGUAGES)
     parser.add_argument("--stream_translate", action='store_true', help="Translate the stream.")
     parser.add_argument("--stream_transcribe", action='store_true', help="Transcribe the stream.")
+    parser.add_argument("--stream_download_workers", default=4, help="How many stream segments are downloaded at the same time. Default is 4.", type=int)
+    parser.add_argument("--http_timeout", default=15, help="Seconds to wait for the stream server before a download counts as failed. Default is 15.", type=float)
+    parser.add_argument("--stream_pipe", action='store_true', help="Decode the stream with one long running ffmpeg process and keep the audio in memory instead of writing segments to the temp folder.")
+    parser.add_argument("--stream_adaptive", action='store_true', help="Adjust --stream_chunks automatically from the measured transcription speed.")
+    parser.add_argument("--stream_chunks_min", default=1, help="Fewest segments per chunk with --stream_adaptive. Default is 1.", type=int)
+    parser.add_argument("--stream_chunks_max", default=10, help="Most segments per chunk with --stream_adaptive. Default is 10.", type=int)
+    parser.add_argument("--stream_target_latency", default=10, help="Caption delay in seconds --stream_adaptive tries to stay under. Default is 10.", type=float)
+    parser.add_argument("--stream_target_rtf", default=0.7, help="Highest real-time factor (transcription time / audio time) --stream_adaptive allows. Default is 0.7.", type=float)
+    parser.add_argument("--stream_align", action='store_true', help="Cut stream chunks at the quietest point near the segment boundary instead of in the middle of a word.")
+    parser.add_argument("--stream_align_window", default=1.0, help="Seconds at the end of each stream chunk searched for a quiet point with --stream_align. Default is 1.", type=float)
+    parser.add_argument("--stream_overlap", default=0.0, help="Seconds of audio before the cut repeated at the start of the next chunk with --stream_align. Repeated words are removed from the output. Default is 0.", type=float)
+    parser.add_argument("--stream_batch_size", default=1, help="Most stream chunks transcribed together in one batch. Default is 1 (no batching).", type=int)
+    parser.add_argument("--stream_batch_wait", default=0.05, help="Seconds a stream batch that is not full waits for more chunks. Default is 0.05.", type=float)
+    parser.add_argument("--stream_workers", default=0, help="Run stream inference in this many worker processes, each pinned to its own CPU cores with its own copy of the model. Default is 0 (inference in the main process).", type=int)
+    parser.add_argument("--stream_queue_size", default=4, help="How many stream chunks can wait for transcription before --stream_overload kicks in. Default is 4.", type=int)
+    parser.add_argument("--stream_latency_budget", default=60, help="Seconds a stream chunk may wait for transcription before it counts as stale. 0 disables the check. Default is 60.", type=float)
+    parser.add_argument("--stream_overload", default="drop_oldest", choices=["drop_oldest", "merge", "degrade"], help="What to do when transcription can't keep up with the stream. Default is drop_oldest.")
+    parser.add_argument("--stream_degrade_model", default="tiny", help="Model used while the stream is overloaded with --stream_overload degrade. Default is tiny.")
     parser.add_argument("--cookies", default=None, help="Path to cookies.txt file. In NetScape format.")
     #parser.add_argument("--is_portable", action='store_true', help="Run the program in portable mode.")
     parser.add_argument("--makecaptions", action='store_true', help="Make captions for the stream.")
@@ -116,6 +163,7 @@ def parse_arguments():
     parser.add_argument("--remote_hls_password_id", type=str, help="Password ID for the webserver. Usually like 'id', or 'key'.")
     parser.add_argument("--remote_hls_password", type=str, help="Password for the hls webserver.")
     args = parser.parse_args()
+    parsed_args = args
     return args
 
 
@@ -0,0 +1,129 @@
+from modules.imports import *
+
+PCM_SAMPLE_RATE = 16000
+
+
+class PcmRingBuffer:
+    """
+    Fixed size ring buffer of float32 samples shared between a writer and a reader thread.
+
+    If the reader falls more than capacity behind, the oldest samples are overwritten and counted
+    in dropped_samples.
+    """
+
+    def __init__(self, capacity):
+        self.buffer = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        self.dropped_samples = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def write(self, samples):
+        with self.condition:
+            if len(samples) > self.capacity:
+                self.dropped_samples += len(samples) - self.capacity
+                samples = samples[-self.capacity:]
+            overflow = self.size + len(samples) - self.capacity
+            if overflow > 0:
+                self.start = (self.start + overflow) % self.capacity
+                self.size -= overflow
+                self.dropped_samples += overflow
+
+            end = (self.start + self.size) % self.capacity
+            first = min(len(samples), self.capacity - end)
+            self.buffer[end:end + first] = samples[:first]
+            self.buffer[:len(samples) - first] = samples[first:]
+            self.size += len(samples)
+            self.condition.notify_all()
+
+    def read(self, n_samples, should_stop=lambda: False):
+        """
+        Blocks until n_samples are buffered and returns them as a new array. Returns whatever is
+        left (or None if empty) once the buffer is closed or should_stop() is true.
+        """
+        with self.condition:
+            while self.size < n_samples and not self.closed and not should_stop():
+                self.condition.wait(timeout=0.25)
+            n_samples = min(n_samples, self.size)
+            if n_samples == 0:
+                return None
+            indices = (self.start + np.arange(n_samples)) % self.capacity
+            samples = self.buffer[indices]
+            self.start = (self.start + n_samples) % self.capacity
+            self.size -= n_samples
+            return samples
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class FfmpegPcmPipe:
+    """
+    One long running ffmpeg process that decodes a stream of container bytes (like HLS .ts
+    segments) written to its stdin into 16 kHz mono float32 PCM.
+
+    The decoded audio is read from ffmpeg's stdout into a PcmRingBuffer, so segments never touch
+    the disk and ffmpeg is only started once per stream instead of once per chunk.
+    """
+
+    def __init__(self, buffer_seconds=120, read_size=PCM_SAMPLE_RATE):
+        self.ring = PcmRingBuffer(buffer_seconds * PCM_SAMPLE_RATE)
+        self.read_size = read_size
+        self.bytes_written = 0
+        self.process = subprocess.Popen(
+            ["ffmpeg", "-nostdin", "-hide_banner", "-loglevel", "error",
+             "-i", "pipe:0", "-vn", "-f", "f32le", "-ac", "1", "-ar", str(PCM_SAMPLE_RATE), "pipe:1"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        )
+        self.reader = threading.Thread(target=self._read_stdout, daemon=True)
+        self.reader.start()
+
+    def _read_stdout(self):
+        pending = b""
+        while True:
+            data = self.process.stdout.read1(self.read_size * 4)
+            if not data:
+                break
+            data = pending + data
+            usable = len(data) - len(data) % 4
+            pending = data[usable:]
+            self.ring.write(np.frombuffer(data[:usable], dtype=np.float32))
+        self.ring.close()
+
+    def write(self, data):
+        """Feeds container bytes to ffmpeg. Returns False if ffmpeg is no longer running."""
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError, ValueError):
+            return False
+        self.bytes_written += len(data)
+        return True
+
+    def read(self, seconds, should_stop=lambda: False):
+        """Blocks until seconds of audio are decoded and returns them, see PcmRingBuffer.read()."""
+        return self.ring.read(int(seconds * PCM_SAMPLE_RATE), should_stop)
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.reader.join(timeout=5)
+        self.ring.close()
+
+    def report(self):
+        return (f"PCM pipe: {self.bytes_written / 1024 / 1024:.1f} MB fed to ffmpeg, "
+                f"{self.ring.size / PCM_SAMPLE_RATE:.1f}s buffered, "
+                f"{self.ring.dropped_samples / PCM_SAMPLE_RATE:.1f}s dropped")
+
+
+print("PCM Pipe Module Loaded")
@@ -0,0 +1,128 @@
+from modules.imports import *
+
+
+class PlaylistPoller:
+    """
+    Reloads a live HLS playlist on the schedule the playlist asks for.
+
+    The next reload is one EXT-X-TARGETDURATION after a playlist with new segments. When nothing
+    changed it retries after half the target duration, backing off up to twice the target duration
+    while the playlist stays the same. Reloads send If-None-Match / If-Modified-Since so an
+    unchanged playlist costs a 304 instead of the full body.
+
+    Segments are tracked by media sequence number, only the highest one handed out is kept, so
+    memory stays the same no matter how long the stream runs.
+    """
+
+    def __init__(self, session, url, default_target_duration=2.0):
+        self.session = session
+        self.url = url
+        self.default_target_duration = default_target_duration
+        self.etag = None
+        self.last_modified = None
+        self.playlist = None
+        self.last_sequence = None
+        self.unchanged_polls = 0
+        self.fetched_at = 0.0
+        self.seen_at = {}
+        self.polls = 0
+        self.not_modified = 0
+        self.lag_count = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+
+    @property
+    def target_duration(self):
+        if self.playlist is not None and self.playlist.target_duration:
+            return float(self.playlist.target_duration)
+        return self.default_target_duration
+
+    def fetch(self):
+        """
+        Loads the playlist, returns the cached one if the server answers 304 Not Modified.
+        Network and HTTP errors are raised as requests exceptions.
+        """
+        headers = {}
+        if self.playlist is not None:
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+
+        self.polls += 1
+        self.fetched_at = time.monotonic()
+        response = self.session.get(self.url, headers=headers)
+        if response.status_code == 304 and self.playlist is not None:
+            self.not_modified += 1
+            return self.playlist
+        response.raise_for_status()
+
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        self.playlist = m3u8.loads(response.text, uri=response.url)
+        return self.playlist
+
+    def new_segments(self, playlist):
+        """Returns (sequence, segment) for every segment newer than the ones already handed out."""
+        first_sequence = playlist.media_sequence or 0
+        last_sequence = first_sequence + len(playlist.segments) - 1
+        if self.last_sequence is not None and last_sequence < self.last_sequence:
+            # Sequence numbers went backwards, the stream restarted.
+            print("Playlist media sequence restarted, following the new stream.")
+            self.last_sequence = None
+
+        now = time.monotonic()
+        segments = []
+        for index, segment in enumerate(playlist.segments):
+            sequence = first_sequence + index
+            if self.last_sequence is not None and sequence <= self.last_sequence:
+                continue
+            segments.append((sequence, segment))
+            self.seen_at[sequence] = now
+
+        if segments:
+            self.last_sequence = segments[-1][0]
+            self.unchanged_polls = 0
+        else:
+            self.unchanged_polls += 1
+        return segments
+
+    def record_download(self, sequence, ok=True):
+        """Records the time from a segment showing up in the playlist to its download finishing."""
+        seen_at = self.seen_at.pop(sequence, None)
+        if seen_at is None or not ok:
+            return
+        lag = time.monotonic() - seen_at
+        self.lag_count += 1
+        self.total_lag += lag
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def next_delay(self):
+        """Seconds until the next reload."""
+        if self.unchanged_polls == 0:
+            return self.target_duration
+        delay = self.target_duration / 2 * 1.5 ** (self.unchanged_polls - 1)
+        return min(delay, self.target_duration * 2)
+
+    def wait(self, should_stop):
+        """
+        Sleeps until the next reload is due, counted from the last fetch so time spent downloading
+        segments is not added on top. Returns early once should_stop() is true.
+        """
+        deadline = self.fetched_at + self.next_delay()
+        while not should_stop():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, 0.25))
+
+    def report(self):
+        average = self.total_lag / self.lag_count if self.lag_count else 0.0
+        return (f"Playlist: {self.polls} reloads, {self.not_modified} not modified, "
+                f"target duration {self.target_duration:g}s, next reload in {self.next_delay():.1f}s | "
+                f"playlist to download lag last {self.last_lag:.2f}s, average {average:.2f}s, max {self.max_lag:.2f}s")
+
+
+print("Playlist Poller Module Loaded")
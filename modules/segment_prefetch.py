@@ -0,0 +1,81 @@
+from modules.imports import *
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SegmentPrefetcher:
+    """
+    Downloads HLS segments on a thread pool and hands them back in media-sequence order.
+
+    Every new segment of a playlist is submitted at once, so catching up on a backlog (after a
+    reconnect or a slow chunk) takes about one round-trip instead of one per segment. Segments that
+    finish early wait until everything before them is done, so they are still combined in order.
+    """
+
+    def __init__(self, download, max_workers=4):
+        self.download = download
+        self.max_workers = max(max_workers, 1)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="segment")
+        self.pending = deque()
+        self.downloaded = 0
+        self.failed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = 0.0
+
+    def _timed_download(self, url, path):
+        start = time.perf_counter()
+        result = self.download(url, path)
+        return result, time.perf_counter() - start
+
+    def submit(self, sequence, url, path):
+        """Queues a segment download. Segments must be submitted in media-sequence order."""
+        future = self.executor.submit(self._timed_download, url, path)
+        self.pending.append((sequence, path, future))
+
+    @property
+    def queue_depth(self):
+        """Segments submitted but not yet handed back."""
+        return len(self.pending)
+
+    def completed(self):
+        """
+        Yields (sequence, path, result) for every submitted segment in media-sequence order, waiting
+        for each one to finish. result is what download() returned, falsy if the download failed.
+        """
+        while self.pending:
+            sequence, path, future = self.pending[0]
+            try:
+                result, latency = future.result()
+            except Exception as e:
+                print(f"Error downloading segment {sequence}: {e}")
+                result, latency = None, 0.0
+            self.pending.popleft()
+
+            if result:
+                self.downloaded += 1
+                self.total_latency += latency
+                self.last_latency = latency
+                self.max_latency = max(self.max_latency, latency)
+            else:
+                self.failed += 1
+            yield sequence, path, result
+
+    def cancel(self):
+        """Drops every download that has not started yet."""
+        while self.pending:
+            _, _, future = self.pending.popleft()
+            future.cancel()
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=True)
+
+    def report(self):
+        average = self.total_latency / self.downloaded if self.downloaded else 0.0
+        return (f"Segments: {self.downloaded} downloaded, {self.failed} failed, {self.queue_depth} queued "
+                f"({self.max_workers} workers) | latency last {self.last_latency * 1000:.0f} ms, "
+                f"average {average * 1000:.0f} ms, max {self.max_latency * 1000:.0f} ms")
+
+
+print("Segment Prefetch Module Loaded")
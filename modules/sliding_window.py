@@ -0,0 +1,113 @@
+from modules.imports import *
+from modules.multitask_inference import decode_features, result_text, word_timings
+
+SAMPLE_RATE = 16000
+
+
+def normalize_word(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+class SlidingWindowTranscriber:
+    """
+    Incremental transcription of one phrase for the microphone loop.
+
+    Only the uncommitted tail of the phrase is kept and re-transcribed on every tick. Words that two
+    consecutive hypotheses agree on are committed and the audio they cover is trimmed off the tail,
+    so per-tick work stays bounded no matter how long the speaker keeps talking. If nothing is
+    agreed on before the tail reaches max_buffer seconds, the older half is committed as-is.
+
+    The tail hypothesis and its word timings are decoded from the tick's EncodedChunk, so the
+    tail goes through the encoder once per tick. Audio committed on a tick is kept in
+    pending_audio, the caller encodes it in one batch with the next tick's tail for the other tasks.
+    """
+
+    def __init__(self, model, fp16=False, max_buffer=15.0):
+        self.model = model
+        self.fp16 = fp16 and model.device.type == "cuda"
+        self.max_buffer = max_buffer
+        self.reset()
+
+    def reset(self):
+        """Starts a new phrase."""
+        self.audio = np.zeros(0, dtype=np.float32)
+        self.committed_words = []
+        self.committed_texts = {}
+        self.hypothesis = []
+        self.pending_audio = None
+
+    def add_audio(self, audio):
+        self.audio = np.concatenate((self.audio, audio))
+
+    @property
+    def committed_text(self):
+        return "".join(self.committed_words).strip()
+
+    @property
+    def text(self):
+        """Committed words followed by the current, not yet agreed on, hypothesis."""
+        return "".join(self.committed_words + [word for _, _, word in self.hypothesis]).strip()
+
+    def commit_text(self, name, text):
+        """Appends text produced for trimmed audio by another task (translation, target language)."""
+        if text:
+            self.committed_texts[name] = f"{self.committed_texts.get(name, '')} {text.strip()}".strip()
+
+    def join_text(self, name, tail_text):
+        """Committed text of another task followed by its output for the current tail."""
+        return f"{self.committed_texts.get(name, '')} {tail_text.strip()}".strip()
+
+    def _transcribe_tail(self, language, chunk):
+        prompt = self.committed_text[-200:] or None
+        if chunk.features is None:
+            # Over whisper's 30 second window, there are no shared features to decode from.
+            result = self.model.transcribe(self.audio, language=language, fp16=self.fp16, word_timestamps=True,
+                                           condition_on_previous_text=False, initial_prompt=prompt)
+            return [(word["start"], word["end"], word["word"])
+                    for segment in result["segments"] for word in segment.get("words", [])]
+
+        with torch.no_grad():
+            result = decode_features(self.model, chunk.features, "transcribe", language, chunk.fp16, prompt=prompt)[0]
+            if not result_text(result, language)["text"]:
+                return []
+            return word_timings(self.model, chunk.features, result.tokens, language, len(self.audio))
+
+    def update(self, language, chunk):
+        """
+        Re-transcribes the tail from chunk (the EncodedChunk of self.audio) and commits the agreed prefix.
+
+        Returns the audio that was trimmed off the tail on this tick (so other tasks can be run on
+        it once), or None if nothing with speech in it was committed.
+        """
+        tail_seconds = len(self.audio) / SAMPLE_RATE
+        hypothesis = self._transcribe_tail(language, chunk)
+
+        agreed = 0
+        for previous, current in zip(self.hypothesis, hypothesis):
+            if normalize_word(previous[2]) != normalize_word(current[2]):
+                break
+            agreed += 1
+
+        if agreed == 0 and tail_seconds > self.max_buffer:
+            keep_from = tail_seconds - self.max_buffer / 2
+            while agreed < len(hypothesis) and hypothesis[agreed][1] <= keep_from:
+                agreed += 1
+
+        trimmed = None
+        if agreed:
+            cut = min(int(hypothesis[agreed - 1][1] * SAMPLE_RATE), len(self.audio))
+            trimmed = self.audio[:cut]
+            self.audio = self.audio[cut:]
+            self.committed_words.extend(word for _, _, word in hypothesis[:agreed])
+            offset = cut / SAMPLE_RATE
+            hypothesis = [(start - offset, end - offset, word) for start, end, word in hypothesis[agreed:]]
+        elif tail_seconds > self.max_buffer:
+            # Nothing recognisable in the tail, drop the oldest audio to stay bounded.
+            self.audio = self.audio[-int(self.max_buffer / 2 * SAMPLE_RATE):]
+            hypothesis = []
+
+        self.hypothesis = hypothesis
+        return trimmed
+
+
+print("Sliding Window Module Loaded")
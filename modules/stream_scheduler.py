@@ -0,0 +1,196 @@
+from modules.imports import *
+from modules.batched_inference import run_jobs, batch_report
+
+
+def load_stream_list(urls=None, filename=None):
+    """
+    Returns (name, url) for every stream of --streams and --streams_file.
+
+    Lines of the file are either a url or "name url", blank lines and lines starting with # are
+    skipped. Streams without a name are named after the last part of their url (the channel name
+    for most sites), with a number added if two streams end up with the same name.
+    """
+    entries = [(None, url) for url in urls or []]
+    if filename:
+        with open(filename, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                parts = line.split(None, 1)
+                entries.append((parts[0], parts[1].strip()) if len(parts) == 2 else (None, parts[0]))
+
+    streams = []
+    names = set()
+    for name, url in entries:
+        base = name or re.sub(r"[^\w-]", "", url.rstrip("/").rsplit("/", 1)[-1].split("?")[0]) or "stream"
+        name, number = base, 2
+        while name in names:
+            name, number = f"{base}{number}", number + 1
+        names.add(name)
+        streams.append((name, url))
+    return streams
+
+
+class StreamChannel:
+    def __init__(self, name, chunk_queue, prepare):
+        self.name = name
+        self.queue = chunk_queue
+        self.prepare = prepare
+        self.done = threading.Event()
+        self.chunks = 0
+        # Jobs taken from the queue whose on_done has not run yet.
+        self.pending = 0
+        self.finished = False
+
+
+class RoundRobinScheduler:
+    """
+    Runs the chunks of one or more streams on a shared model from a single inference thread.
+
+    Every stream keeps its own chunk queue. The scheduler takes one chunk from each stream with
+    work waiting in turn, so a busy channel can't starve the others, and memory is one model for
+    all streams instead of one model per stream.
+
+    Chunks that are ready together are transcribed as one batch of up to max_batch chunks (one
+    encoder pass and one decoder pass per task and language, see run_jobs()). With max_wait set,
+    a batch that is not full waits up to max_wait seconds for more chunks before it runs.
+
+    With a pool (InferenceWorkerPool) batches run in worker processes instead, several at once.
+    A stream's next chunk is only taken once its previous ones are done, so captions stay in order.
+    """
+
+    def __init__(self, max_batch=1, max_wait=0.0, pool=None):
+        self.max_batch = max(max_batch, 1)
+        self.max_wait = max_wait
+        self.pool = pool
+        self.channels = []
+        self.offset = 0
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def add_stream(self, name, chunk_queue, prepare):
+        """
+        Registers a stream. prepare(queued) is called with each (chunk, queued_at) of its queue and
+        returns the InferenceJob to run, or None if the chunk does not need transcribing.
+        """
+        channel = StreamChannel(name, chunk_queue, prepare)
+        chunk_queue.on_change = self.wake.set
+        with self.lock:
+            self.channels.append(channel)
+        self.wake.set()
+        return channel
+
+    def _track(self, channel, job):
+        on_done = job.on_done
+        called = []
+
+        def done(job, chunk):
+            # A batch that failed part way is failed as a whole, jobs that already finished are skipped.
+            with self.lock:
+                if called:
+                    return
+                called.append(True)
+            try:
+                on_done(job, chunk)
+            finally:
+                with self.lock:
+                    channel.pending -= 1
+                    if channel.finished and not channel.pending:
+                        channel.done.set()
+
+        job.on_done = done
+        with self.lock:
+            channel.pending += 1
+
+    def _collect(self, jobs, finished, taken):
+        """One round-robin pass over the streams, returns True if any of them had a chunk."""
+        with self.lock:
+            channels = self.channels[self.offset:] + self.channels[:self.offset]
+            self.offset = (self.offset + 1) % max(len(self.channels), 1)
+
+        found = False
+        for channel in channels:
+            if len(jobs) >= self.max_batch:
+                break
+            if self.pool and channel.pending and channel not in taken:
+                # Its previous chunks are still on a worker.
+                continue
+            queued = channel.queue.get(block=False)
+            if queued is not None:
+                found = True
+                channel.chunks += 1
+                try:
+                    job = channel.prepare(queued)
+                except Exception as e:
+                    print(f"Error preparing audio of stream {channel.name}: {e}")
+                    job = None
+                if job is not None:
+                    self._track(channel, job)
+                    taken.add(channel)
+                    jobs.append(job)
+            elif channel.queue.closed:
+                # Stream stopped and everything it queued is taken.
+                with self.lock:
+                    self.channels.remove(channel)
+                finished.append(channel)
+        return found
+
+    def _run(self):
+        while not self.stopped:
+            if self.pool and not self.pool.wait_for_worker(timeout=0.5):
+                continue
+            self.wake.clear()
+            jobs, finished, taken = [], [], set()
+            while len(jobs) < self.max_batch and self._collect(jobs, finished, taken):
+                pass
+
+            if jobs and self.max_wait:
+                deadline = time.monotonic() + self.max_wait
+                while len(jobs) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.wake.clear()
+                    if not self._collect(jobs, finished, taken):
+                        self.wake.wait(remaining)
+
+            try:
+                if jobs and self.pool:
+                    self.pool.submit(jobs)
+                elif jobs:
+                    run_jobs(jobs)
+            except Exception as e:
+                # The streams wait for every chunk they queued, so a failed batch still finishes its jobs.
+                print(f"Error running inference batch: {e}")
+                for job in jobs:
+                    try:
+                        job.on_done(job, None)
+                    except Exception as e:
+                        print(f"Error handling transcription: {e}")
+            with self.lock:
+                for channel in finished:
+                    channel.finished = True
+                    if not channel.pending:
+                        channel.done.set()
+            if not jobs and not finished:
+                self.wake.wait(timeout=0.5)
+
+    def stop(self):
+        self.stopped = True
+        self.wake.set()
+
+    def report(self):
+        with self.lock:
+            streams = " | ".join(f"{channel.name}: {channel.chunks} chunks, {channel.queue.depth} queued"
+                                 for channel in self.channels)
+        stats = self.pool.report() if self.pool else batch_report()
+        return f"{streams} | {stats}" if streams else stats
+
+
+print("Stream Scheduler Module Loaded")
@@ -1,14 +1,18 @@
 # stream_transcription_module.py
 from modules.imports import *
+from modules.adaptive_chunks import AdaptiveChunkSizer
+from modules.batched_inference import InferenceJob, batch_report
+from modules.chunk_queue import LatencyBoundedQueue, CaptionDelay
+from modules.chunk_seams import SeamAligner
+from modules.multitask_inference import compare_audio_ctx
+from modules.pcm_pipe import FfmpegPcmPipe
+from modules.playlist_poller import PlaylistPoller
+from modules.segment_prefetch import SegmentPrefetcher
+from modules.stream_scheduler import RoundRobinScheduler
+from modules.voice_activity import VoiceActivityDetector
 
-# Global shutdown flag
-shutdown_flag = False
-args = parser_args.parse_arguments()
-kill = False
-
-# Semaphore for limiting concurrent downloads (adjust as needed)
-max_concurrent_downloads = 4
-download_semaphore = threading.Semaphore(max_concurrent_downloads)
+# Stop events of the running streams by task id, set by stop_transcription()
+active_streams = {}
 
 
 def load_cookies_from_file(cookie_file_path):
@@ -30,7 +34,24 @@ def start_stream_transcription(
     webhook_url,
     cookie_file_path=None,
     streamkey=None,
+    ignore_filter=None,
+    args=None,
+    stream_name=None,
+    scheduler=None,
+    stop_event=None,
+    degrade_pool=None,
 ):
+    """
+    Downloads and transcribes one HLS stream until stop_transcription() is called.
+
+    With a scheduler (multi-stream mode) the chunks are transcribed by the scheduler's shared
+    inference thread instead of a processing thread of this stream, and output is labeled with
+    stream_name.
+
+    degrade_pool is the ModelManager with the --stream_degrade_model model, shared by every stream.
+    """
+    if args is None:
+        args = parser_args.parse_arguments()
 
     if streamkey:
         keyid = args.remote_hls_password_id
@@ -39,35 +60,68 @@ def start_stream_transcription(
     else:
         params = None
 
-    global shutdown_flag
-    audio_queue = queue.Queue()
+    # Set to stop this stream, by stop_transcription() or when the stream can't be read anymore.
+    if stop_event is None:
+        stop_event = threading.Event()
+    active_streams[task_id] = stop_event
+    label = f"[{stream_name}] " if stream_name else ""
+
+    def publish(kind, text):
+        # Single stream mode keeps updating the web server's main headers, with several streams
+        # every stream has its own.
+        if not args.portnumber:
+            return
+        if stream_name:
+            api_backend.update_stream_header(stream_name, kind, text)
+        elif kind == "original":
+            api_backend.update_header(text)
+        elif kind == "translated":
+            api_backend.update_translated_header(text)
+        elif kind == "transcribed":
+            api_backend.update_transcribed_header(text)
+        elif kind == "caption_delay":
+            api_backend.update_caption_delay(text)
+
+    if args.vad:
+        vad = VoiceActivityDetector(energy_threshold=args.vad_energy, flatness_threshold=args.vad_flatness, min_speech=args.vad_min_speech)
+    else:
+        vad = None
+
+    if args.stream_align:
+        seams = SeamAligner(search_window=args.stream_align_window, overlap=args.stream_overlap)
+    else:
+        seams = None
 
     # Load cookies if a cookie file path is provided
     cookies = None
     if cookie_file_path:
         cookies = load_cookies_from_file(cookie_file_path)
 
+    # One keep-alive session for the playlist and all segment downloads of this stream, so the
+    # TCP/TLS handshake is paid once per connection instead of once per request.
+    session = create_session(pool_size=args.stream_download_workers + 1, timeout=args.http_timeout,
+                             cookies=cookies, params=params)
+
     def download_segment(
         segment_url, output_path, max_retries=3, retry_delay=0.5, segment_delay=0
     ):
-        """Downloads a segment with retry logic and improved error handling."""
-        global kill
-        with download_semaphore:
-            for retry_count in range(max_retries + 1):
-                try:
-                    # show downloading segments if args debug is set
-                    if args.debug:
-                        print(f"\n\n\nDownloading segment: {segment_url}\n\n")
-                    response = (
-                        requests.get(
-                            segment_url, stream=True, cookies=cookies, params=params
-                        )
-                        if cookies
-                        else requests.get(segment_url, stream=True, params=params)
-                    )
-
+        """
+        Downloads a segment with retry logic and improved error handling.
+        Without an output_path the segment is kept in memory and its bytes are returned.
+        """
+        for retry_count in range(max_retries + 1):
+            if stop_event.is_set():
+                break
+            try:
+                # show downloading segments if args debug is set
+                if args.debug:
+                    print(f"\n\n\nDownloading segment: {segment_url}\n\n")
+                # Closed on every status, so a failed request hands its connection back to the pool.
+                with session.get(segment_url, stream=True) as response:
                     # Check for successful response
                     if response.status_code == 200:
+                        if output_path is None:
+                            return response.content
                         with open(output_path, "wb") as file:
                             for chunk in response.iter_content(chunk_size=16000):
                                 file.write(chunk)
@@ -78,33 +132,33 @@ def start_stream_transcription(
                             "Invalid credentials. Please check your cookies/streamkey and try again."
                         )
                         input("Press CTRL+C to exit...")
-                        kill = True
+                        stop_event.set()
                         raise Exception("Exiting due to invalid credentials")
                     else:
                         print(
                             f"Failed to download segment, status code: {response.status_code}. Retrying {retry_count}/{max_retries}"
                         )
-                except requests.exceptions.RequestException as e:
-                    print(
-                        f"Network error: {e}. Retrying {retry_count}/{max_retries} in {retry_delay} seconds..."
-                    )
-                    time.sleep(retry_delay)
-                except Exception as e:
-                    print(f"Unexpected error downloading segment: {e}")
-                    break
+            except requests.exceptions.RequestException as e:
+                print(
+                    f"Network error: {e}. Retrying {retry_count}/{max_retries} in {retry_delay} seconds..."
+                )
+                time.sleep(retry_delay)
+            except Exception as e:
+                print(f"Unexpected error downloading segment: {e}")
+                break
 
         print(
             f"Failed to download segment {segment_url} after {max_retries} retries. Skipping."
         )
         # Clean up partial file if exists
-        if os.path.exists(output_path):
+        if output_path and os.path.exists(output_path):
             os.remove(output_path)
         return False
 
-    def load_m3u8_with_retry(hls_url, retry_delay=5):
-        while not shutdown_flag:
+    def load_m3u8_with_retry(poller, retry_delay=5):
+        while not stop_event.is_set():
             try:
-                m3u8_obj = m3u8.load(hls_url)
+                m3u8_obj = poller.fetch()
                 return m3u8_obj
             except (
                 http.client.RemoteDisconnected,
@@ -137,173 +191,306 @@ def start_stream_transcription(
                 except Exception as e:
                     print(f"Error combining audio segments: {e}")
 
-    def translate_audio(file_path, model):
-        try:
-            result = model.transcribe(file_path, task="translate", fp16=args.fp16, language=stream_language, condition_on_previous_text=args.condition_on_previous_text)
-            return result["text"]
-        except RuntimeError as e:
-            print(f"Error transcribing audio: {e}")
-            return ""
+    def prepare_audio(queued):
+        """
+        Decodes, aligns and trims one queued chunk. Returns the InferenceJob that transcribes it,
+        or None if there is nothing to transcribe.
+        """
+        file_path, queued_at = queued
+        # With --stream_pipe the chunk arrives already decoded instead of as a .ts file.
+        from_file = isinstance(file_path, str)
+        if from_file and not os.path.exists(file_path):
+            print(f"Warning: File {file_path} does not exist, skipping.")
+            chunk_done(queued_at)
+            return None
 
-    def transcribe_audio(file_path, model, language):
         try:
-            result = model.transcribe(file_path, language=language, fp16=args.fp16, condition_on_previous_text=args.condition_on_previous_text)
-            return result["text"]
+            audio = whisper.load_audio(file_path) if from_file else file_path
         except RuntimeError as e:
             print(f"Error transcribing audio: {e}")
-            return ""
-
-    def detect_language(file_path, model, device=args.device):
+            audio = None
         try:
-            audio = whisper.load_audio(file_path)
-            audio = whisper.pad_or_trim(audio)
-            
-            # Handle both "12gb-v2" and "12gb-v3"
-            if args.ram == "12gb-v2":
-                mel = whisper.log_mel_spectrogram(audio, n_mels=80).to(device)
-            elif args.ram == "12gb-v3":
-                mel = whisper.log_mel_spectrogram(audio, n_mels=128).to(device)
+            if from_file and os.path.exists(file_path):
+                os.remove(file_path)
+        except Exception as e:
+            print(f"Error removing file {file_path}: {e}")
+        if audio is None:
+            chunk_done(queued_at)
+            return None
+
+        audio_seconds = len(audio) / whisper.audio.SAMPLE_RATE
+        if seams:
+            audio = seams.align(audio)
+        if vad:
+            audio = vad.trim(audio)
+            if args.debug:
+                print(vad.report())
+            if audio is None:
+                chunk_done(queued_at)
+                return None
+
+        model = model_name
+        if args.stream_overload == "degrade" and audio_queue.overloaded:
+            if degrade_pool:
+                # Picked per chunk, the pool is shared with streams that are not overloaded.
+                model = degrade_pool.get(args.stream_degrade_model) or model_name
             else:
-                mel = whisper.log_mel_spectrogram(audio, n_mels=80).to(device)
-
-            _, language_probs = model.detect_language(mel)
-            detected_language = max(language_probs, key=language_probs.get)
-            return detected_language
-        except RuntimeError as e:
-            print(f"Error detecting language: {e}")
-            detected_language = "n/a"
-            return detected_language
-
-
-    def process_audio(file_path, model):
-        if not os.path.exists(file_path):
-            print(f"Warning: File {file_path} does not exist, skipping.")
-            return
+                # With --stream_workers the model is a name and the workers load the faster one themselves.
+                model = args.stream_degrade_model
+        if args.audio_ctx_compare and not isinstance(model, str):
+            compare_audio_ctx(model, audio, stream_language, fp16=args.fp16, audio_ctx_bucket=args.audio_ctx_bucket)
 
+        # Every decode this chunk needs, so the scheduler can batch them with other chunks.
+        tasks = []
+        if args.stream_original_text:
+            tasks.append(("transcribe", stream_language if args.stream_language else None))
+        if tasktranslate_task:
+            tasks.append(("translate", stream_language))
+        if tasktranscribe_task:
+            tasks.append(("transcribe", target_language))
+        return InferenceJob(audio, model, tasks, finish_chunk, fp16=args.fp16,
+                            condition_on_previous_text=args.condition_on_previous_text,
+                            audio_ctx=args.audio_ctx, audio_ctx_bucket=args.audio_ctx_bucket,
+                            context={"queued_at": queued_at, "audio_seconds": audio_seconds})
+
+    def finish_chunk(job, chunk):
+        """Prints and publishes the transcriptions of a chunk once its batch is done."""
+        def run_task(task, language):
+            try:
+                text = chunk.transcribe(task=task, language=language)["text"]
+                if seams:
+                    text = seams.dedupe(f"{task}:{language}", text)
+                return ignore_filter.filter(text) if ignore_filter else text
+            except RuntimeError as e:
+                print(f"Error transcribing audio: {e}")
+                return ""
+
+        original = None
         transcription = None
         translation = None
-        if args.stream_original_text:
+        detected_language = stream_language
+        if chunk is not None and args.stream_original_text:
             if args.stream_language:
                 detected_language = stream_language
                 # print(f"Language Set By Args: {detected_language}")
             else:
                 # print("Testing for Language")
-                detected_language = detect_language(file_path, model)
+                try:
+                    detected_language, _ = chunk.detect_language()
+                except RuntimeError as e:
+                    print(f"Error detecting language: {e}")
+                    detected_language = "n/a"
                 # print(f"Language is: {detected_language}")
-            transcription = transcribe_audio(
-                file_path, model, language=detected_language
-            )
-            print(f"{'-' * 50} {detected_language} Original {'-' * 50}")
-            print(transcription)
-            if args.portnumber and transcription.strip():
-                new_header = f"{transcription}"
-                api_backend.update_header(new_header)
-
-        if tasktranslate_task:
-            translation = translate_audio(file_path, model)
+            original = run_task("transcribe", None if detected_language == "n/a" else detected_language)
+            print(f"{label}{'-' * 50} {detected_language} Original {'-' * 50}")
+            print(original)
+            if original.strip():
+                publish("original", original)
+
+        if chunk is not None and tasktranslate_task:
+            translation = run_task("translate", stream_language)
             if translation:
-                print(f"{'-' * 50} Stream EN Translation {'-' * 50}")
+                print(f"{label}{'-' * 50} Stream EN Translation {'-' * 50}")
                 print(translation)
                 if webhook_url:
                     send_to_discord_webhook(
-                        webhook_url, f"Stream EN Translation:\n{translation}\n"
+                        webhook_url, f"{label}Stream EN Translation:\n{translation}\n"
                     )
-                if args.portnumber:
-                    new_header = f"{translation}"
-                    api_backend.update_translated_header(new_header)
+                publish("translated", translation)
 
-        if tasktranscribe_task:
-            transcription = transcribe_audio(
-                file_path, model, language=target_language
-            )
+        if chunk is not None and tasktranscribe_task:
+            transcription = run_task("transcribe", target_language)
             if transcription:
                 print(
-                    f"{'-' * 50} Stream {target_language} Transcription {'-' * 50}"
+                    f"{label}{'-' * 50} Stream {target_language} Transcription {'-' * 50}"
                 )
                 print(transcription)
                 if webhook_url:
                     send_to_discord_webhook(
                         webhook_url,
-                        f"Stream {target_language} Transcription:\n{transcription}\n",
+                        f"{label}Stream {target_language} Transcription:\n{transcription}\n",
                     )
-                if args.portnumber and transcription.strip():
-                    new_header = f"{transcription}"
-                    api_backend.update_transcribed_header(new_header)
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except Exception as e:
-            print(f"Error removing file {file_path}: {e}")
+                if transcription.strip():
+                    publish("transcribed", transcription)
+
+        if args.portnumber and any(text and text.strip() for text in (original, translation, transcription)):
+            api_backend.add_caption(original, translation, transcription, detected_language, stream_name)
+
+        chunk_done(job.context["queued_at"], job.context["audio_seconds"] if chunk is not None else None, job.inference_seconds)
+
+    def chunk_done(queued_at, audio_seconds=None, inference_seconds=0.0):
+        # Skipped chunks count for the caption delay but not for the chunk size.
+        if chunk_sizer and audio_seconds:
+            chunk_sizer.record_chunk(audio_seconds, inference_seconds)
+        publish("caption_delay", caption_delay.record(queued_at))
+        if args.debug:
+            print(label + caption_delay.report(audio_queue))
+            if chunk_sizer:
+                print(f"{label}Stream chunks: {chunk_sizer.segments} segments ({chunk_sizer.report()})")
+
+    def merge_chunks(first, second):
+        # Combined .ts files can simply be appended, decoded audio is concatenated.
+        if isinstance(first, str):
+            try:
+                with open(first, "ab") as outfile, open(second, "rb") as infile:
+                    outfile.write(infile.read())
+                os.remove(second)
+            except Exception as e:
+                print(f"Error merging audio chunks: {e}")
+            return first
+        return np.concatenate([first, second])
+
+    def discard_chunk(chunk):
+        if isinstance(chunk, str) and os.path.exists(chunk):
+            os.remove(chunk)
+
+    audio_queue = LatencyBoundedQueue(max_size=args.stream_queue_size, latency_budget=args.stream_latency_budget,
+                                      policy=args.stream_overload, merge=merge_chunks, discard=discard_chunk)
+    caption_delay = CaptionDelay()
+
+    # --stream_adaptive: the number of segments per chunk follows the measured inference speed.
+    if args.stream_adaptive:
+        chunk_sizer = AdaptiveChunkSizer(segments_max, min_segments=args.stream_chunks_min, max_segments=args.stream_chunks_max,
+                                         target_latency=args.stream_target_latency, target_rtf=args.stream_target_rtf)
+    else:
+        chunk_sizer = None
 
-    # Thread function for processing audio
-    def process_audio_thread():
-        while not shutdown_flag:
-            file_path = audio_queue.get()
-            if file_path is None:
-                break
-            process_audio(file_path, model_name)
+    def chunk_segments():
+        return chunk_sizer.segments if chunk_sizer else segments_max
 
-    # Start processing thread
-    processing_thread = threading.Thread(target=process_audio_thread)
-    processing_thread.daemon = True
-    processing_thread.start()
+    # All inference runs on the scheduler's thread. In multi-stream mode it is shared by every
+    # stream, otherwise this stream gets its own, which still batches up a backlog of chunks.
+    own_scheduler = scheduler is None
+    if own_scheduler:
+        scheduler = RoundRobinScheduler(max_batch=args.stream_batch_size, max_wait=args.stream_batch_wait)
+        scheduler.start()
+    channel = scheduler.add_stream(stream_name or str(task_id), audio_queue, prepare_audio)
 
     # Main loop for downloading and combining segments
+    prefetcher = SegmentPrefetcher(download_segment, max_workers=args.stream_download_workers)
+    poller = PlaylistPoller(session, hls_url)
+
+    # --stream_pipe: segments are fed straight into one ffmpeg process and chunks of decoded
+    # audio are cut from its output, nothing is written to temp_dir.
+    if args.stream_pipe:
+        pcm_pipe = FfmpegPcmPipe()
+
+        def pcm_chunk_thread():
+            while True:
+                audio = pcm_pipe.read(chunk_segments() * poller.target_duration, stop_event.is_set)
+                if audio is None or stop_event.is_set():
+                    break
+                audio_queue.put(audio)
+
+        chunk_thread = threading.Thread(target=pcm_chunk_thread, daemon=True)
+        chunk_thread.start()
+    else:
+        pcm_pipe = None
+
     try:
-        downloaded_segments = set()
         counter = 0
         accumulated_segments = []
 
-        while not shutdown_flag:
-            m3u8_obj = load_m3u8_with_retry(hls_url)
+        while not stop_event.is_set():
+            m3u8_obj = load_m3u8_with_retry(poller)
             if not m3u8_obj:
                 print("Failed to load m3u8 after retries, stopping.")
                 break
 
-            for segment in m3u8_obj.segments:
-                if segment.uri in downloaded_segments:
-                    continue  # Skip already downloaded segments
-
-                segment_path = generate_segment_filename(
-                    segment.uri, counter, task_id
-                )
+            # Start every new segment at once, then take them back in playlist order.
+            for sequence, segment in poller.new_segments(m3u8_obj):
+                if chunk_sizer:
+                    chunk_sizer.record_segment(segment.duration)
+                if pcm_pipe:
+                    segment_path = None
+                else:
+                    segment_path = generate_segment_filename(
+                        segment.uri, counter, task_id
+                    )
                 counter += 1
-                try:
-                    if download_segment(segment.absolute_uri, segment_path):
-                        if kill:
-                            break
-                        downloaded_segments.add(segment.uri)
-                        accumulated_segments.append(segment_path)
-
-                        if len(accumulated_segments) >= segments_max:
-                            combined_path = os.path.join(
-                                temp_dir, f"{task_id}_combined_{counter}.ts"
-                            )
-                            combine_audio_segments(
-                                accumulated_segments, combined_path
-                            )
-                            audio_queue.put(combined_path)
-                            accumulated_segments = []
-                except Exception as e:  # Catch the raised exception
-                    print(f"Error during download: {e}")
-                    break  # Exit the loop
+                prefetcher.submit(sequence, segment.absolute_uri, segment_path)
 
-    except KeyboardInterrupt:
-        shutdown_flag = True  # Signal to shut down
+            if args.debug and prefetcher.queue_depth:
+                print(f"Fetching {prefetcher.queue_depth} new segments")
 
-    except Exception as e:
-        exit(0)
+            for sequence, segment_path, result in prefetcher.completed():
+                poller.record_download(sequence, bool(result))
+                if stop_event.is_set():
+                    prefetcher.cancel()
+                    break
+                if not result:
+                    continue
+                if pcm_pipe:
+                    if not pcm_pipe.write(result):
+                        print(f"{label}ffmpeg stopped decoding the stream, stopping.")
+                        stop_event.set()
+                    continue
+                accumulated_segments.append(segment_path)
 
-    # Cleanup
-    for file in os.listdir(temp_dir):
-        os.remove(os.path.join(temp_dir, file))
-    audio_queue.put(None)  # Signal processing thread to stop
-    processing_thread.join()
+                if len(accumulated_segments) >= chunk_segments():
+                    combined_path = os.path.join(
+                        temp_dir, f"{task_id}_combined_{sequence}.ts"
+                    )
+                    combine_audio_segments(
+                        accumulated_segments, combined_path
+                    )
+                    audio_queue.put(combined_path)
+                    accumulated_segments = []
+                    if args.debug:
+                        print(prefetcher.report())
+                        print(poller.report())
 
+            poller.wait(stop_event.is_set)
 
-def stop_transcription():
-    global shutdown_flag
-    shutdown_flag = True
+    except KeyboardInterrupt:
+        stop_event.set()  # Signal to shut down
+
+    except Exception as e:
+        # Logged instead of exiting, so the stream still shuts down cleanly below.
+        print(f"{label}Error in stream transcription: {e}")
+
+    finally:
+        # Cleanup
+        stop_event.set()
+        prefetcher.shutdown()
+        print(label + prefetcher.report())
+        print(label + poller.report())
+        session.close()
+        if pcm_pipe:
+            pcm_pipe.close()
+            chunk_thread.join()
+            print(label + pcm_pipe.report())
+        # Only this stream's files, other streams share the temp folder.
+        for file in os.listdir(temp_dir):
+            if file.startswith(f"{task_id}_"):
+                try:
+                    os.remove(os.path.join(temp_dir, file))
+                except OSError as e:
+                    print(f"Error removing file {file}: {e}")
+        # Chunks still waiting are dropped, the stream is stopping.
+        while audio_queue.get(block=False) is not None:
+            pass
+        audio_queue.close()  # Signal the scheduler that this stream is done
+        channel.done.wait()
+        if own_scheduler:
+            if args.stream_batch_size > 1:
+                print(label + batch_report())
+            scheduler.stop()
+        print(label + caption_delay.report(audio_queue))
+        if chunk_sizer:
+            print(f"{label}Stream chunks: {chunk_sizer.segments} segments ({chunk_sizer.report()})")
+        if vad:
+            print(label + vad.report())
+        if seams:
+            print(label + seams.report())
+        active_streams.pop(task_id, None)
+
+
+def stop_transcription(task_id=None):
+    """Stops the stream with this task id, or every running stream."""
+    for stream_id, stop_event in list(active_streams.items()):
+        if task_id is None or stream_id == task_id:
+            stop_event.set()
 
 
 print("Stream Transcription Module Loaded")
\ No newline at end of file
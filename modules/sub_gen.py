@@ -1,12 +1,11 @@
 # Import necessary modules. Ensure 'modules.imports' contains all required imports.
 from modules.imports import *
-# Parse command-line arguments. Make sure 'parser_args.parse_arguments()' is properly set up in your project.
-args = parser_args.parse_arguments()
-
 
 
 # Function to detect language from an audio file.
-def run_sub_gen(input_path: str, output_name: str = "", output_directory: str = "./"):
+def run_sub_gen(args, input_path: str, output_name: str = "", output_directory: str = "./"):
+    from whisper.utils import get_writer
+
     model_type = parser_args.set_model_by_ram(args.ram, args.language)
     print("Loading Model")
     model = whisper.load_model(model_type)
@@ -0,0 +1,95 @@
+from modules.imports import *
+
+
+def build_trie_pattern(phrases):
+    """
+    Builds one regex alternation for all phrases, shaped like a trie so shared prefixes are only
+    matched once. Every phrase is regex-escaped, so characters like "?" or "(" are taken literally.
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def to_regex(node):
+        alternatives = [re.escape(char) + to_regex(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        if len(alternatives) == 1:
+            pattern = alternatives[0]
+            if "" in node:
+                pattern = f"(?:{pattern})?"
+        else:
+            pattern = f"(?:{'|'.join(alternatives)})"
+            if "" in node:
+                pattern += "?"
+        return pattern
+
+    return to_regex(trie)
+
+
+class IgnoreListFilter:
+    """
+    Removes the phrases of an --ignorelist file from caption text.
+
+    All phrases are compiled once into a single case-insensitive pattern, so even thousands of
+    phrases cost one scan per string. Phrases only match as whole words. The file is checked for
+    changes at most once every check_interval seconds and reloaded when its mtime changes.
+    """
+
+    def __init__(self, filename=None, check_interval=1.0):
+        if filename and not filename.endswith(".txt"):
+            raise ValueError("Blacklist file must be in .txt format.")
+
+        self.filename = filename
+        self.check_interval = check_interval
+        self.phrases = []
+        self.pattern = None
+        self.mtime = None
+        self.last_check = 0.0
+        self.lock = threading.Lock()
+        if filename:
+            self.load()
+
+    def load(self):
+        try:
+            mtime = os.path.getmtime(self.filename)
+            with open(self.filename, "r", encoding="utf-8") as f:
+                phrases = [line.strip().lower() for line in f if line.strip()]
+        except FileNotFoundError:
+            print(f"Warning: Blacklist file '{self.filename}' not found.")
+            mtime = None
+            phrases = []
+
+        if phrases:
+            pattern = re.compile(rf"(?<!\w){build_trie_pattern(sorted(set(phrases)))}(?!\w)", re.IGNORECASE)
+        else:
+            pattern = None
+        self.phrases, self.pattern, self.mtime = phrases, pattern, mtime
+
+    def reload_if_changed(self):
+        now = time.monotonic()
+        if not self.filename or now - self.last_check < self.check_interval:
+            return
+        with self.lock:
+            self.last_check = now
+            try:
+                mtime = os.path.getmtime(self.filename)
+            except OSError:
+                mtime = None
+            if mtime != self.mtime:
+                self.load()
+                print(f"Reloaded word filtering list from: {self.filename} ({len(self.phrases)} phrases)")
+
+    def filter(self, text):
+        """Returns the text with every ignored phrase removed."""
+        self.reload_if_changed()
+        pattern = self.pattern
+        if pattern is None or not text:
+            return text
+        return re.sub(r"\s{2,}", " ", pattern.sub("", text)).strip()
+
+
+print("Text Filter Module Loaded")
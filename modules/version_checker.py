@@ -8,7 +8,7 @@ repo_name = "Synthalingua"
 
 def get_remote_version(repo_owner, repo_name, updatebranch, file_path):
     url = f"https://raw.githubusercontent.com/{repo_owner}/{repo_name}/{updatebranch}/{file_path}"
-    response = requests.get(url)
+    response = shared_session().get(url)
 
     # if the response failed then return None
     if response.status_code != 200:
@@ -0,0 +1,86 @@
+from modules.imports import *
+
+SAMPLE_RATE = 16000
+FRAME_LENGTH = 480  # 30 ms frames
+# Band the spectral flatness is measured in, where voiced speech has most of its harmonics.
+FLATNESS_BAND = (100, 4000)
+
+
+class VoiceActivityDetector:
+    """
+    Lightweight CPU voice activity detector used to keep silence and noise away from whisper.
+
+    Audio is split into 30 ms frames. A frame counts as speech when it is louder than
+    energy_threshold (dBFS) and its spectrum is not flat like noise (spectral flatness below
+    flatness_threshold). Chunks with less than min_speech seconds of speech are dropped, the rest
+    can be trimmed down to the speech they contain plus some padding.
+    """
+
+    def __init__(self, energy_threshold=-45.0, flatness_threshold=0.45, min_speech=0.3, padding=0.3):
+        self.energy_threshold = energy_threshold
+        self.flatness_threshold = flatness_threshold
+        self.min_speech = min_speech
+        self.padding = padding
+
+        frequencies = np.fft.rfftfreq(FRAME_LENGTH, 1 / SAMPLE_RATE)
+        self.band = (frequencies >= FLATNESS_BAND[0]) & (frequencies <= FLATNESS_BAND[1])
+        self.window = np.hanning(FRAME_LENGTH).astype(np.float32)
+
+        self.total_seconds = 0.0
+        self.skipped_seconds = 0.0
+        self.skipped_chunks = 0
+
+    def speech_frames(self, audio):
+        """Returns a boolean per 30 ms frame telling whether it looks like speech."""
+        n_frames = len(audio) // FRAME_LENGTH
+        if n_frames == 0:
+            return np.zeros(0, dtype=bool)
+        frames = audio[:n_frames * FRAME_LENGTH].reshape(n_frames, FRAME_LENGTH)
+
+        energy = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+        spectrum = np.abs(np.fft.rfft(frames * self.window, axis=1))[:, self.band] ** 2 + 1e-10
+        flatness = np.exp(np.mean(np.log(spectrum), axis=1)) / np.mean(spectrum, axis=1)
+
+        return (energy > self.energy_threshold) & (flatness < self.flatness_threshold)
+
+    def _count(self, total, skipped):
+        self.total_seconds += total
+        self.skipped_seconds += skipped
+        if skipped >= total:
+            self.skipped_chunks += 1
+
+    def has_speech(self, audio):
+        """True if the chunk holds at least min_speech seconds of speech. Dropped chunks are counted."""
+        speech = self.speech_frames(audio)
+        duration = len(audio) / SAMPLE_RATE
+        if speech.sum() * FRAME_LENGTH / SAMPLE_RATE < self.min_speech:
+            self._count(duration, duration)
+            return False
+        self._count(duration, 0.0)
+        return True
+
+    def trim(self, audio):
+        """
+        Returns the chunk cut down to the span between its first and last speech frame plus padding,
+        or None if it does not hold enough speech to be worth transcribing.
+        """
+        speech = self.speech_frames(audio)
+        duration = len(audio) / SAMPLE_RATE
+        if speech.sum() * FRAME_LENGTH / SAMPLE_RATE < self.min_speech:
+            self._count(duration, duration)
+            return None
+
+        indices = np.flatnonzero(speech)
+        padding = int(self.padding * SAMPLE_RATE)
+        start = max(indices[0] * FRAME_LENGTH - padding, 0)
+        end = min((indices[-1] + 1) * FRAME_LENGTH + padding, len(audio))
+        self._count(duration, (len(audio) - (end - start)) / SAMPLE_RATE)
+        return audio[start:end]
+
+    def report(self):
+        percent = self.skipped_seconds / self.total_seconds * 100 if self.total_seconds else 0.0
+        return (f"VAD skipped {self.skipped_seconds:.1f}s of {self.total_seconds:.1f}s audio ({percent:.0f}%), "
+                f"{self.skipped_chunks} chunks dropped")
+
+
+print("Voice Activity Module Loaded")
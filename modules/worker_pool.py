@@ -0,0 +1,324 @@
+from modules.imports import *
+import multiprocessing
+from multiprocessing import shared_memory
+from modules.batched_inference import InferenceJob, run_jobs
+from modules.cpu_inference import configure_cpu_threads, load_int8_model, physical_cores
+
+
+def physical_core_groups(count):
+    """
+    Splits the cores this process may run on into up to count groups of whole physical cores.
+
+    Hyperthread siblings (read from /sys on Linux) always end up in the same group, so workers
+    never share a physical core with each other.
+    """
+    cores = physical_cores()
+    count = max(1, min(count, len(cores)))
+    return [[cpu for core in cores[i * len(cores) // count:(i + 1) * len(cores) // count] for cpu in core]
+            for i in range(count)]
+
+
+def _worker_main(index, cpus, model_name, model_dir, device, int8, cpu_threads, tasks, results):
+    """Loop of one worker process: load the model, then transcribe the batches sent to it."""
+    try:
+        if cpus and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cpus)
+        if device == "cpu":
+            # Threads follow the pinned cores unless --cpu_threads is set.
+            configure_cpu_threads(cpu_threads)
+
+        models = {}
+
+        def load(name):
+            if name not in models:
+                if int8 and device == "cpu":
+                    models[name] = load_int8_model(name, model_dir)
+                else:
+                    models[name] = whisper.load_model(name, device=device, download_root=model_dir)
+            return models[name]
+
+        try:
+            load(model_name)
+        except Exception as e:
+            results.put(("error", index, None, str(e)))
+            return
+        results.put(("ready", index, None, None))
+
+        while True:
+            batch = tasks.get()
+            if batch is None:
+                break
+            batch_id, items = batch
+            start = time.perf_counter()
+            outcomes = {}
+
+            def collect(job, chunk):
+                outcomes[job.context["id"]] = (_chunk_results(job, chunk), job.inference_seconds)
+
+            jobs = []
+            for job_id, memory_name, n_samples, model, job_tasks, settings in items:
+                memory = shared_memory.SharedMemory(name=memory_name)
+                try:
+                    audio = np.ndarray((n_samples,), dtype=np.float32, buffer=memory.buf).copy()
+                finally:
+                    memory.close()
+                try:
+                    job_model = load(model or model_name)
+                except Exception as e:
+                    print(f"Inference worker {index} could not load model {model}: {e}")
+                    outcomes[job_id] = (None, 0.0)
+                    continue
+                jobs.append(InferenceJob(audio, job_model, job_tasks, collect, context={"id": job_id}, **settings))
+
+            run_jobs(jobs)
+            results.put(("done", index, batch_id, (outcomes, time.perf_counter() - start)))
+    except KeyboardInterrupt:
+        pass
+
+
+def _chunk_results(job, chunk):
+    """The texts of a finished chunk as plain data that can go back through the result queue."""
+    if chunk is None:
+        return None
+    language, language_probs, error = None, None, None
+    if any(task_language is None for _, task_language in job.tasks):
+        try:
+            language, language_probs = chunk.detect_language()
+        except RuntimeError as e:
+            error = str(e)
+
+    texts, errors = {}, {}
+    for task, task_language in job.tasks:
+        key = (task, task_language or language)
+        if key[1] is None:
+            errors[key] = error
+            continue
+        try:
+            texts[key] = {"text": chunk.transcribe(task=task, language=key[1])["text"], "language": key[1]}
+        except RuntimeError as e:
+            errors[key] = str(e)
+    return language, language_probs, texts, errors
+
+
+class RemoteChunk:
+    """What a worker process sent back for one chunk, read like an EncodedChunk."""
+
+    def __init__(self, language, language_probs, texts, errors):
+        self.language = language
+        self.language_probs = language_probs
+        self.texts = texts
+        self.errors = errors
+
+    def detect_language(self):
+        if self.language is None:
+            raise RuntimeError("the worker did not detect a language for this chunk")
+        return self.language, self.language_probs
+
+    def transcribe(self, task="transcribe", language=None, retry=False):
+        if language is None:
+            language, _ = self.detect_language()
+        if (task, language) in self.texts:
+            return self.texts[(task, language)]
+        raise RuntimeError(self.errors.get((task, language)) or f"the worker did not run {task} ({language})")
+
+
+class InferenceWorker:
+    def __init__(self, index, process, tasks, cpus):
+        self.index = index
+        self.process = process
+        self.tasks = tasks
+        self.cpus = cpus
+        self.ready = False
+        self.alive = True
+        self.batch = None
+        self.ready_at = None
+        self.batches = 0
+        self.chunks = 0
+        self.busy_seconds = 0.0
+
+
+class InferenceWorkerPool:
+    """
+    Runs stream inference in separate worker processes instead of a thread of this process.
+
+    Every worker is pinned to its own group of physical cores, sets its torch threads for them and
+    loads its own copy of the model, so CPU inference scales with the cores and never competes
+    with the downloaders, the web server or Discord posting for the GIL. Chunk audio goes to the
+    workers through shared memory, only the texts come back through the result queue.
+
+    A worker takes one batch at a time. The scheduler waits for a free worker before it takes more
+    chunks, so chunks keep waiting in the stream queues where the overload policy applies.
+    """
+
+    def __init__(self, workers, model_name, model_dir, device="cpu", int8=False, cpu_threads=0):
+        context = multiprocessing.get_context("spawn")
+        if device == "cpu":
+            groups = physical_core_groups(workers)
+            if len(groups) < workers:
+                print(f"Only {len(groups)} physical cores available, starting {len(groups)} inference workers instead of {workers}.")
+        else:
+            groups = [[] for _ in range(max(workers, 1))]
+
+        self.model_name = model_name
+        self.results = context.Queue()
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.next_batch = 0
+        self.stopped = False
+        self.workers = []
+        for index, cpus in enumerate(groups):
+            tasks = context.Queue()
+            process = context.Process(target=_worker_main, name=f"inference-worker-{index}", daemon=True,
+                                      args=(index, cpus, model_name, model_dir, device, int8, cpu_threads, tasks, self.results))
+            process.start()
+            self.workers.append(InferenceWorker(index, process, tasks, cpus))
+        print(f"Started {len(self.workers)} inference worker processes, loading {model_name} in each.")
+
+        self.collector = threading.Thread(target=self._collect_results, daemon=True)
+        self.collector.start()
+
+    def _idle_worker(self):
+        for worker in self.workers:
+            if worker.alive and worker.ready and worker.batch is None:
+                return worker
+        return None
+
+    def wait_for_worker(self, timeout=None):
+        """
+        Waits until a worker can take a batch. Also returns True once every worker has stopped, so
+        submit() fails the chunks instead of the streams waiting forever.
+        """
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: self._idle_worker() is not None or not any(worker.alive for worker in self.workers), timeout)
+
+    def submit(self, jobs):
+        """Sends a batch of InferenceJobs to a free worker. Their on_done is called from the collector thread."""
+        with self.condition:
+            worker = self._idle_worker()
+            if worker is not None:
+                batch_id = self.next_batch
+                self.next_batch += 1
+                worker.batch = batch_id
+
+        if worker is None:
+            print("No inference worker is running, skipping the chunks.")
+            self._finish(jobs, None)
+            return
+
+        items, memories = [], []
+        with self.condition:
+            self.pending[batch_id] = (worker, jobs, memories)
+        try:
+            for job_id, job in enumerate(jobs):
+                audio = np.ascontiguousarray(job.audio, dtype=np.float32)
+                memory = shared_memory.SharedMemory(create=True, size=max(audio.nbytes, 1))
+                memories.append(memory)
+                np.ndarray(audio.shape, dtype=np.float32, buffer=memory.buf)[:] = audio
+                settings = {"fp16": job.fp16, "condition_on_previous_text": job.condition_on_previous_text,
+                            "audio_ctx": job.audio_ctx, "audio_ctx_bucket": job.audio_ctx_bucket}
+                # Models go by name, every worker loads its own.
+                model = job.model if isinstance(job.model, str) else None
+                items.append((job_id, memory.name, len(audio), model, job.tasks, settings))
+            worker.tasks.put((batch_id, items))
+        except Exception:
+            # Frees the worker and the shared memory, the scheduler fails the jobs.
+            with self.condition:
+                self._release(batch_id)
+                self.condition.notify_all()
+            raise
+
+    def _finish(self, jobs, outcomes):
+        for job_id, job in enumerate(jobs):
+            chunk = None
+            if outcomes and outcomes.get(job_id):
+                results, job.inference_seconds = outcomes[job_id]
+                if results is not None:
+                    chunk = RemoteChunk(*results)
+            try:
+                job.on_done(job, chunk)
+            except Exception as e:
+                print(f"Error handling transcription: {e}")
+
+    def _release(self, batch_id):
+        worker, jobs, memories = self.pending.pop(batch_id)
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+        worker.batch = None
+        return jobs
+
+    def _collect_results(self):
+        while not self.stopped:
+            try:
+                kind, index, batch_id, payload = self.results.get(timeout=1.0)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            except (EOFError, OSError):
+                break
+
+            worker = self.workers[index]
+            jobs, outcomes = [], None
+            with self.condition:
+                if kind == "ready":
+                    worker.ready = True
+                    worker.ready_at = time.monotonic()
+                    print(f"Inference worker {index} ready{f' on cores {worker.cpus}' if worker.cpus else ''}.")
+                elif kind == "error":
+                    worker.alive = False
+                    print(f"Inference worker {index} could not load the model: {payload}")
+                elif kind == "done" and batch_id in self.pending:
+                    jobs = self._release(batch_id)
+                    outcomes, seconds = payload
+                    worker.batches += 1
+                    worker.chunks += len(jobs)
+                    worker.busy_seconds += seconds
+                self.condition.notify_all()
+            if jobs:
+                self._finish(jobs, outcomes)
+
+    def _check_workers(self):
+        """Fails the batch of a worker process that died so its streams carry on."""
+        failed = []
+        with self.condition:
+            for worker in self.workers:
+                if worker.alive and not worker.process.is_alive():
+                    worker.alive = False
+                    print(f"Inference worker {worker.index} stopped (exit code {worker.process.exitcode}).")
+                    if worker.batch is not None:
+                        failed.append(self._release(worker.batch))
+            if failed:
+                self.condition.notify_all()
+        for jobs in failed:
+            self._finish(jobs, None)
+
+    def stop(self, timeout=5.0):
+        self.stopped = True
+        for worker in self.workers:
+            if worker.process.is_alive():
+                worker.tasks.put(None)
+        for worker in self.workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        with self.condition:
+            for batch_id in list(self.pending):
+                self._release(batch_id)
+            self.condition.notify_all()
+
+    def report(self):
+        now = time.monotonic()
+        parts = []
+        for worker in self.workers:
+            if not worker.alive:
+                parts.append(f"worker {worker.index}: stopped")
+            elif not worker.ready:
+                parts.append(f"worker {worker.index}: loading")
+            else:
+                busy = worker.busy_seconds / max(now - worker.ready_at, 1e-6)
+                parts.append(f"worker {worker.index}: {worker.chunks} chunks in {worker.batches} batches, {busy * 100:.0f}% busy")
+        return "Inference workers: " + " | ".join(parts)
+
+
+print("Worker Pool Module Loaded")
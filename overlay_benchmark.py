@@ -0,0 +1,201 @@
+"""
+Load test for the caption overlay web server.
+
+Starts the web server in its own process (or uses a running one with --url) and simulates
+--clients overlays for --duration seconds:
+
+  page    every client loads the overlay page and its static files over and over
+  poll    every client asks /captions every --interval seconds with If-None-Match
+  events  every client keeps /caption-events open while the captions change --rate times a second
+
+Prints requests per second and latency percentiles. For events the latency is the time from a
+caption changing on the server to a client receiving it.
+
+Example: python overlay_benchmark.py --clients 300 --mode poll --web_server production
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+PAGE_PATHS = ("/", "/player.html", "/static/index.js", "/static/styles.css")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Load test for the caption overlay web server.")
+    parser.add_argument("--mode", default="poll", choices=["page", "poll", "events"], help="What the simulated overlays do. Default is poll.")
+    parser.add_argument("--clients", default=200, help="Number of simulated overlays. Default is 200.", type=int)
+    parser.add_argument("--duration", default=10.0, help="Seconds to run. Default is 10.", type=float)
+    parser.add_argument("--interval", default=0.1, help="Seconds between two requests of one polling client. Default is 0.1.", type=float)
+    parser.add_argument("--rate", default=2.0, help="Caption changes per second on the started server. Default is 2.", type=float)
+    parser.add_argument("--url", default=None, help="Benchmark an already running server instead of starting one, example: http://localhost:4000")
+    parser.add_argument("--port", default=4555, help="Port of the started server. Default is 4555.", type=int)
+    parser.add_argument("--web_server", default="production", choices=["production", "dev"], help="Server to start, same as --web_server of transcribe_audio.py.")
+    parser.add_argument("--web_threads", default=0, help="Threads of the started production server. Default is one more than --clients.", type=int)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def serve(args):
+    """Runs the web server and changes the captions --rate times a second (the --serve process)."""
+    sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+    from modules import api_backend
+
+    api_backend.flask_server("start", args.port, server=args.web_server, threads=args.web_threads)
+    while True:
+        if not args.rate:
+            time.sleep(3600)
+            continue
+        time.sleep(1 / args.rate)
+        # The change time goes into the caption so the clients can measure the delivery latency.
+        api_backend.update_header(f"benchmark {time.time():.6f}")
+
+
+def start_server(args):
+    threads = args.web_threads or args.clients + 1
+    command = [sys.executable, os.path.realpath(__file__), "--serve", "--port", str(args.port), "--rate", str(args.rate),
+               "--web_server", args.web_server, "--web_threads", str(threads)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit("The web server exited, run transcribe_audio.py with --portnumber to see why.")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", args.port, timeout=1)
+            connection.request("GET", "/captions")
+            connection.getresponse().read()
+            connection.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    sys.exit("The web server did not start within 30 seconds.")
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100 * (len(values) - 1))))]
+
+
+class Client(threading.Thread):
+    def __init__(self, args, host, port, stop):
+        super().__init__(daemon=True)
+        self.args = args
+        self.host = host
+        self.port = port
+        self.stop = stop
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+        self.connected = False
+
+    def connect(self):
+        return http.client.HTTPConnection(self.host, self.port, timeout=30)
+
+    def request(self, connection, path, headers=None):
+        start = time.perf_counter()
+        connection.request("GET", path, headers=headers or {})
+        response = connection.getresponse()
+        body = response.read()
+        self.latencies.append(time.perf_counter() - start)
+        self.statuses[response.status] = self.statuses.get(response.status, 0) + 1
+        return response, body
+
+    def run(self):
+        connection = self.connect()
+        etag = None
+        while not self.stop.is_set():
+            try:
+                if self.args.mode == "events":
+                    self.listen(connection)
+                elif self.args.mode == "page":
+                    for path in PAGE_PATHS:
+                        self.request(connection, path)
+                else:
+                    response, _ = self.request(connection, "/captions", {"If-None-Match": etag} if etag else None)
+                    etag = response.getheader("ETag") or etag
+                    self.stop.wait(self.args.interval)
+            except (OSError, http.client.HTTPException):
+                self.errors += 1
+                connection.close()
+                connection = self.connect()
+                self.stop.wait(0.1)
+
+    def listen(self, connection):
+        connection.request("GET", "/caption-events")
+        response = connection.getresponse()
+        self.statuses[response.status] = self.statuses.get(response.status, 0) + 1
+        self.connected = True
+        first = True
+        while not self.stop.is_set():
+            line = response.readline()
+            if not line:
+                raise http.client.HTTPException("event stream closed")
+            if not line.startswith(b"data:"):
+                continue
+            captions = json.loads(line[5:])
+            # The first event is the state at connect time, not a change.
+            if not first and captions["original"].startswith("benchmark "):
+                self.latencies.append(time.time() - float(captions["original"].split()[1]))
+            first = False
+
+
+def main():
+    args = parse_arguments()
+    if args.serve:
+        serve(args)
+        return
+
+    server = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        server = start_server(args)
+        host, port = "127.0.0.1", args.port
+    print(f"Benchmarking {args.mode} with {args.clients} clients for {args.duration:g}s against {host}:{port}...")
+
+    threading.stack_size(256 * 1024)
+    stop = threading.Event()
+    clients = [Client(args, host, port, stop) for _ in range(args.clients)]
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    time.sleep(args.duration)
+    stop.set()
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        if args.mode != "events":
+            client.join(timeout=5)
+    if server:
+        server.kill()
+
+    latencies = [latency for client in clients for latency in client.latencies]
+    statuses = {}
+    for client in clients:
+        for status, count in client.statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+    errors = sum(client.errors for client in clients)
+
+    if args.mode == "events":
+        connected = sum(client.connected for client in clients)
+        print(f"{connected}/{args.clients} clients connected, {len(latencies)} events received ({len(latencies) / elapsed:.1f}/s)")
+        label = "delivery latency"
+    else:
+        print(f"{len(latencies)} requests in {elapsed:.1f}s: {len(latencies) / elapsed:.1f} requests/s")
+        label = "latency"
+    print(f"{label}: p50 {percentile(latencies, 50) * 1000:.1f} ms, p90 {percentile(latencies, 90) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} ms, max {max(latencies, default=0) * 1000:.1f} ms")
+    print(f"status codes: {dict(sorted(statuses.items()))}, errors: {errors}")
+
+
+if __name__ == "__main__":
+    main()
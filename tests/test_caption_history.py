@@ -0,0 +1,25 @@
+from modules import api_backend
+
+
+def run_tick(original, translated, phrase_complete):
+    # Same call the microphone loop makes once per tick.
+    api_backend.publish_phrase(original, translated, "", "es", revise_last=not phrase_complete)
+
+
+def test_two_phrases_keep_their_own_text():
+    api_backend.set_caption_history(10)
+
+    # First phrase grows over two ticks, the second one starts after a pause.
+    run_tick("hola", "hello", phrase_complete=False)
+    run_tick("hola amigo", "hello friend", phrase_complete=False)
+    run_tick("adios", "goodbye", phrase_complete=True)
+    run_tick("adios amigo", "goodbye friend", phrase_complete=False)
+
+    entries = api_backend.caption_history.page()["entries"]
+    assert [(entry["original"], entry["translated"]) for entry in entries] == [
+        ("hola amigo", "hello friend"),
+        ("adios amigo", "goodbye friend"),
+    ]
+    assert [entry["revision"] for entry in entries] == [1, 1]
+    assert api_backend.header_text == "adios amigo"
+    assert api_backend.translated_header_text == "goodbye friend"
@@ -1,3 +1,5 @@
+import multiprocessing
+
 try:
     print("Loading Primary Imports")
     from modules.imports import *
@@ -10,11 +12,6 @@ except Exception as e:
 
 init()
 
-try:
-    cuda_available = torch.cuda.is_available()
-except:
-    cuda_available = False
-
 # Code is semi documented, but if you have any questions, feel free to ask in the Discussions tab.
 
 def main():
@@ -22,32 +19,52 @@ def main():
     global translated_text, target_language, language_probs, webhook_url, required_vram, original_text, phrase_timeout
     args = parser_args.parse_arguments()
 
-    def load_blacklist(filename):
-        if not filename.endswith(".txt"):
-            raise ValueError("Blacklist file must be in .txt format.")
+    if len(sys.argv) == 1:
+        print("No arguments provided. Please run the script with the --help flag to see a list of available arguments.")
+        sys.exit(1)
 
-        blacklist = []
-        try:
-            with open(filename, "r", encoding="utf-8") as f:
-                for line in f:
-                    blacklist.append(line.strip())
-        except FileNotFoundError:
-            print(f"Warning: Blacklist file '{filename}' not found.")
-        return blacklist
+    # Commands that don't need a model are handled before anything heavy (torch, whisper, flask) is imported.
+    if args.about:
+        if args.startup_profile:
+            print_startup_report("--about")
+        from modules.about import contributors
+        from modules.version_checker import ScriptCreator, GitHubRepo
+        contributors(ScriptCreator, GitHubRepo)
 
-    if args.ignorelist:
-        print(f"Loaded word filtering list from: {args.ignorelist}")
-        blacklist = load_blacklist(args.ignorelist)
+    def is_input_device(device_index):
+        pa = pyaudio.PyAudio()
+        device_info = pa.get_device_info_by_index(device_index)
+        return device_info['maxInputChannels'] > 0
 
-    else:
-        blacklist = []
+    if args.list_microphones:
+        print("Available microphone devices are: ")
+        mic_table = PrettyTable()
+        mic_table.field_names = ["Index", "Microphone Name"]
 
-    # if blacklist.txt was found say loaded
-    if len(blacklist) > 0:
-        print(f"Loaded blacklist: {blacklist}")
+        for index, name in enumerate(sr.Microphone.list_microphone_names()):
+            if is_input_device(index):
+                mic_table.add_row([index, name])
+
+        print(mic_table)
+        if args.startup_profile:
+            print_startup_report("--list_microphones")
+        input(f"Press {Fore.YELLOW}[enter]{Style.RESET_ALL} to exit.")
+        sys.exit(0)
+
+    # Compiled once, shared with the stream module and reloaded when the file changes.
+    ignore_filter = IgnoreListFilter(args.ignorelist)
+    if args.ignorelist:
+        print(f"Loaded word filtering list from: {args.ignorelist} ({len(ignore_filter.phrases)} phrases)")
+
+    # --streams / --streams_file caption several streams at once with one model
+    multi_stream = bool(args.streams or args.streams_file)
+    if args.stream != None and multi_stream:
+        print("Use either --stream for one stream or --streams / --streams_file for several, not both.")
+        sys.exit("Exiting...")
+    stream_mode = args.stream != None or multi_stream
 
     # Check for Stream or Microphone is no present then exit
-    if args.stream == None and args.microphone_enabled == None:
+    if not stream_mode and args.microphone_enabled == None:
         if args.makecaptions:
             # skip if makecaptions is set
             pass
@@ -61,7 +78,7 @@ def main():
 
 
     # If stream and microphone is set then exit saying you can only use one input source
-    if args.stream != None and args.microphone_enabled != None:
+    if stream_mode and args.microphone_enabled != None:
         print("You can only use one input source. Please only set one input source.")
         reset_text = Style.RESET_ALL
         input(f"Press {Fore.YELLOW}[enter]{reset_text} to exit.")
@@ -82,14 +99,9 @@ def main():
             print("Error: " + str(e))
             print("Continuing with script...\n\n")
 
-    def record_callback(_, audio:sr.AudioData) -> None:
+    def record_callback(_, audio: "sr.AudioData") -> None:
         data = audio.get_raw_data()
-        data_queue.put(data)
-
-    def is_input_device(device_index):
-        pa = pyaudio.PyAudio()
-        device_info = pa.get_device_info_by_index(device_index)
-        return device_info['maxInputChannels'] > 0
+        data_queue.put((time.monotonic(), data))
 
     def get_microphone_source(args):
         pa = pyaudio.PyAudio()
@@ -120,15 +132,6 @@ def main():
 
         raise ValueError("No valid input devices found.")
 
-    if len(sys.argv) == 1:
-        print("No arguments provided. Please run the script with the --help flag to see a list of available arguments.")
-        sys.exit(1)
-
-    if args.about:
-        from modules.about import contributors
-        from modules.version_checker import ScriptCreator, GitHubRepo
-        contributors(ScriptCreator, GitHubRepo)
-
     model = ""
 
     hardmodel = None
@@ -151,19 +154,6 @@ def main():
             recorder.adjust_for_ambient_noise(source, duration=args.mic_calibration_time)
             print(f"Calibration complete. The microphone is set to: {Fore.YELLOW}" + str(recorder.energy_threshold) + f"{reset_text}")
 
-    if args.list_microphones:
-        print("Available microphone devices are: ")
-        mic_table = PrettyTable()
-        mic_table.field_names = ["Index", "Microphone Name"]
-
-        for index, name in enumerate(sr.Microphone.list_microphone_names()):
-            if is_input_device(index):
-                mic_table.add_row([index, name])
-
-        print(mic_table)
-        input(f"Press {Fore.YELLOW}[enter]{reset_text} to exit.")
-        sys.exit(0)
-
     if args.microphone_enabled:
         if args.mic_calibration_time:
             print("Mic calibration flag detected.\n")
@@ -243,7 +233,10 @@ def main():
 
     if args.portnumber:
         print("Port number was set, so spinning up a web server...")
-        api_backend.flask_server(operation="start", portnumber=args.portnumber)
+        api_backend.set_caption_history(args.caption_history)
+        api_backend.set_subtitle_settings(args.subtitle_segment_duration, args.subtitle_window)
+        api_backend.flask_server(operation="start", portnumber=args.portnumber, server=args.web_server,
+                                 threads=args.web_threads, https=args.web_https)
 
     try:
         if args.microphone_enabled:
@@ -302,6 +295,10 @@ def main():
 
     print("Now using ram flag: " + args.ram)
 
+    if device.type == "cpu":
+        from modules.cpu_inference import configure_cpu_threads
+        configure_cpu_threads(args.cpu_threads)
+
     # Obsolete -- Will Adjust in future
     #if args.ram == "1gb" or args.ram == "2gb" or args.ram == "4gb":
     #    red_text = Style.BRIGHT + Fore.RED
@@ -388,7 +385,16 @@ def main():
         if args.target_language != "en" or args.target_language != "English":
             model = model.replace(".en", "")
             print(f"Loading model {model} instead since target language is not English...")
-        audio_model = whisper.load_model(model, device=device, download_root=f"{args.model_dir}")
+        if args.stream_workers and stream_mode:
+            # Every inference worker loads its own copy, this process only needs the name.
+            audio_model = None
+        elif args.int8 and device.type == "cpu":
+            from modules.cpu_inference import load_int8_model
+            audio_model = load_int8_model(model, f"{args.model_dir}")
+        else:
+            if args.int8:
+                print("WARNING: --int8 only applies to CPU inference, loading the regular model.")
+            audio_model = whisper.load_model(model, device=device, download_root=f"{args.model_dir}")
 
     if args.microphone_enabled:
         record_timeout = args.record_timeout
@@ -403,8 +409,8 @@ def main():
     else:
         keep = False
         print("Keeping temporary files disabled.")
-    if args.microphone_enabled:
-        temp_file = NamedTemporaryFile(dir=temp_dir, delete=keep, suffix=".ts", prefix="rec_").name
+    if args.microphone_enabled and keep:
+        temp_file = NamedTemporaryFile(dir=temp_dir, delete=False, suffix=".wav", prefix="rec_").name
     transcription = ['']
 
     if args.discord_webhook:
@@ -415,12 +421,37 @@ def main():
         recorder.listen_in_background(source, record_callback, phrase_time_limit=record_timeout)
 
     print("Model loaded.\n")
+    if args.startup_profile:
+        print_startup_report("model loaded")
     print(f"Using {model} model.")
 
     if device.type == "cuda":
         if "AMD" in torch.cuda.get_device_name(torch.cuda.current_device()):
             print("WARNING: You are using an AMD GPU with CUDA. This may not work properly. If you experience issues, try using the CPU instead.")
 
+    # fp16 only exists on the GPU, on CPU everything runs in fp32 (or int8 with --int8).
+    use_fp16 = args.fp16 and device.type == "cuda"
+
+    if args.sliding_window and args.microphone_enabled:
+        from modules.sliding_window import SlidingWindowTranscriber
+        sliding_window = SlidingWindowTranscriber(audio_model, fp16=use_fp16, max_buffer=args.sliding_window_max)
+    else:
+        sliding_window = None
+
+    if args.auto_model_swap:
+        from modules.model_manager import ModelManager
+        model_pool = ModelManager(device, f"{args.model_dir}", max_models=args.model_pool_size, memory_budget_mb=args.model_pool_memory,
+                                  int8=args.int8 and device.type == "cpu")
+        model_pool.add(model, audio_model)
+    else:
+        model_pool = None
+
+    if args.vad:
+        from modules.voice_activity import VoiceActivityDetector
+        vad = VoiceActivityDetector(energy_threshold=args.vad_energy, flatness_threshold=args.vad_flatness, min_speech=args.vad_min_speech)
+    else:
+        vad = None
+
     english_counter = 0
     language_counters = {}
     last_detected_language = None
@@ -429,7 +460,7 @@ def main():
         # from modules.sub_gen import run_sub_gen
         if args.file_output_name == None:
             args.file_output_name = "filename"
-        run_sub_gen(args.file_input, args.file_output_name, args.file_output)
+        run_sub_gen(args, args.file_input, args.file_output_name, args.file_output)
         print("Press enter to exit...")
         input()
         sys.exit("Exiting...")
@@ -446,15 +477,26 @@ def main():
         if args.discord_webhook:
             send_to_discord_webhook(webhook_url, "Auto language lock enabled. Will auto lock after 5 consecutive detections of the same language.")
 
-    if args.stream:
+    worker_pool = None
+    if stream_mode:
         print("Stream mode enabled.")
-        print(f"You have chosen to use the stream {args.stream}.")
+        from modules.model_manager import ModelManager
+        from modules.stream_scheduler import load_stream_list, RoundRobinScheduler
+        from modules.stream_transcription_module import start_stream_transcription, stop_transcription
+        from modules.worker_pool import InferenceWorkerPool
 
         # Define the temp directory and model name
         temp_dir = os.path.join(os.getcwd(), "./temp")
         os.makedirs(temp_dir, exist_ok=True)
         model_name = audio_model  # or any other model you want to use
 
+        # --stream_workers: inference runs in worker processes pinned to their own cores.
+        if args.stream_workers:
+            worker_device = f"cuda:{torch.cuda.current_device()}" if device.type == "cuda" else "cpu"
+            worker_pool = InferenceWorkerPool(args.stream_workers, model, f"{args.model_dir}", device=worker_device,
+                                              int8=args.int8, cpu_threads=args.cpu_threads)
+            model_name = model
+
         stream_language = args.stream_language
         if args.stream_target_language:
             target_language = args.stream_target_language
@@ -477,37 +519,70 @@ def main():
         else:
             webhook_url = None
 
-        cookie_file_path = None
-        # Get HLS URL using yt-dlp
-        hls_url = subprocess.check_output(["yt-dlp", args.stream, "-g"]).decode("utf-8").strip()
+        if multi_stream:
+            # Every stream gets its own ingest thread, their chunks take turns on the one loaded model.
+            streams = load_stream_list(args.streams, args.streams_file)
+            print(f"Multi-stream mode: {len(streams)} streams sharing one model.")
+        else:
+            streams = [(None, args.stream)]
+        if multi_stream or worker_pool:
+            scheduler = RoundRobinScheduler(max_batch=args.stream_batch_size, max_wait=args.stream_batch_wait, pool=worker_pool)
+            scheduler.start()
+        else:
+            scheduler = None
+
+        # With --stream_overload degrade a faster model is loaded in the background, once for all
+        # streams, and used for the chunks of a stream for as long as its queue is overloaded.
+        if args.stream_overload == "degrade" and not worker_pool:
+            degrade_pool = ModelManager(device, f"{args.model_dir}", max_models=2, int8=args.int8 and device.type == "cpu")
+            degrade_pool.add(model, audio_model)
+            degrade_pool.preload(args.stream_degrade_model)
+        else:
+            degrade_pool = None
 
+        cookie_file_path = None
         if args.cookies:
             # f"cookies\\{args.cookies}.txt"
             cookie_file_path = f"cookies\\{args.cookies}.txt"
-            # update hls_url with cookies if cookies are set
-            hls_url = subprocess.check_output(["yt-dlp", args.stream, "-g", "--cookies", cookie_file_path]).decode("utf-8").strip()
-
-
-        print(f"Found the Stream URL:\n{hls_url}")
-
-        # generated a random 6 digit number for the task id
-        import random
-        task_id = random.randint(100000, 999999)
 
         if args.remote_hls_password_id:
             streamkey = True
         else:
             streamkey = False
 
-
-        # Start stream transcription
-        segments_max = args.stream_chunks if hasattr(args, 'stream_chunks') else 1
-        # start start_stream_transcription(hls_url, model_name, temp_dir, segments_max) in a new thread
-        stream_thread = threading.Thread(target=start_stream_transcription,
-                                         args=(task_id, hls_url, model_name, temp_dir, segments_max, target_language, stream_language, tasktranslate_task, tasktranscribe_task, webhook_url, cookie_file_path, streamkey))
-        stream_thread.start()
+        import random
+        stream_threads = []
+        for stream_name, stream_url in streams:
+            print(f"You have chosen to use the stream {stream_url}.")
+            # Get HLS URL using yt-dlp, with cookies if cookies are set
+            try:
+                if cookie_file_path:
+                    hls_url = subprocess.check_output(["yt-dlp", stream_url, "-g", "--cookies", cookie_file_path]).decode("utf-8").strip()
+                else:
+                    hls_url = subprocess.check_output(["yt-dlp", stream_url, "-g"]).decode("utf-8").strip()
+            except subprocess.CalledProcessError as e:
+                if not multi_stream:
+                    raise
+                print(f"Could not get the stream URL of {stream_url}, skipping it: {e}")
+                continue
+
+            print(f"Found the Stream URL:\n{hls_url}")
+
+            # generated a random 6 digit number for the task id
+            task_id = random.randint(100000, 999999)
+
+            # Start stream transcription
+            segments_max = args.stream_chunks if hasattr(args, 'stream_chunks') else 1
+            # start start_stream_transcription(hls_url, model_name, temp_dir, segments_max) in a new thread
+            stream_thread = threading.Thread(target=start_stream_transcription,
+                                             args=(task_id, hls_url, model_name, temp_dir, segments_max, target_language, stream_language, tasktranslate_task, tasktranscribe_task, webhook_url, cookie_file_path, streamkey),
+                                             kwargs={"ignore_filter": ignore_filter, "args": args, "stream_name": stream_name, "scheduler": scheduler,
+                                                     "degrade_pool": degrade_pool})
+            stream_thread.start()
+            stream_threads.append(stream_thread)
 
     if args.microphone_enabled:
+        from modules.multitask_inference import EncodedChunk, compare_audio_ctx
         print("Awaiting audio stream from microphone...")
     else:
         print("Microphone disabled. Awaiting audio stream from stream...")
@@ -529,308 +604,299 @@ def main():
     while True:
 
         try:
-            now = datetime.utcnow()
-            if not data_queue.empty():
-                if args.no_log == False:
-                    print("\nAudio stream detected...")
-                phrase_complete = False
-                if phrase_time and now - phrase_time > timedelta(seconds=phrase_timeout):
-                    last_sample = bytes()
-                    phrase_complete = True
-                phrase_time = now
-
-
-                while not data_queue.empty():
-                    data = data_queue.get()
-                    last_sample += data
-
+            try:
+                # Block until record_callback hands over audio instead of polling the queue once a second.
+                audio_time, data = data_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            latest_time = audio_time
+            while not data_queue.empty():
+                latest_time, queued_data = data_queue.get()
+                data += queued_data
+
+            # Silence and room noise never reach the model, and count as a gap for phrase_timeout.
+            if vad and not vad.has_speech(np.frombuffer(data, dtype=np.int16).astype(np.float32) / 32768.0):
+                if args.debug:
+                    print(vad.report())
+                continue
+
+            if args.no_log == False:
+                print("\nAudio stream detected...")
+            # A new line starts when the gap since the previous audio arrived is longer than phrase_timeout.
+            phrase_complete = False
+            if phrase_time and audio_time - phrase_time > phrase_timeout:
+                last_sample = bytes()
+                phrase_complete = True
+                if sliding_window:
+                    sliding_window.reset()
+            last_sample += data
+            phrase_time = latest_time
+
+            # The microphone hands us raw 16 kHz 16-bit mono PCM, so it can go straight into a
+            # float32 array for whisper without a wav file or an ffmpeg decode in between.
+            audio_np = np.frombuffer(last_sample, dtype=np.int16).astype(np.float32) / 32768.0
+
+            if keep:
                 audio_data = sr.AudioData(last_sample, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
-                wav_data = io.BytesIO(audio_data.get_wav_data())
-
                 with open(temp_file, 'w+b') as f:
-                    f.write(wav_data.read())
-
-                audio = whisper.load_audio(temp_file)
-                audio = whisper.pad_or_trim(audio)
-                # if ram is set to 12 use n_mels=128 else use n_mels=80
-                if args.ram == "12gb-v2":
-                    mel = whisper.log_mel_spectrogram(audio, n_mels=80).to(device)
-                elif args.ram == "12gb-v3":
-                    mel = whisper.log_mel_spectrogram(audio, n_mels=128).to(device)
+                    f.write(audio_data.get_wav_data())
+
+            if sliding_window:
+                # Only the uncommitted tail of the phrase is transcribed again.
+                sliding_window.add_audio(audio_np)
+                last_sample = bytes()
+                audio_np = sliding_window.audio
+
+            if model_pool:
+                # Picks up a model that finished loading in the background since the last chunk.
+                model, audio_model = model_pool.current()
+                if sliding_window:
+                    sliding_window.model = audio_model
+
+            # Mel spectrogram and encoder run once here, every decode below (the sliding window's tail
+            # hypothesis too) reuses them.
+            committed_chunk = None
+            if sliding_window and sliding_window.pending_audio is not None:
+                # Audio committed on the previous tick goes through the encoder in the same batch as the tail.
+                chunk, committed_chunk = EncodedChunk.encode_batch(audio_model, [audio_np, sliding_window.pending_audio], fp16=use_fp16,
+                                                                   condition_on_previous_text=args.condition_on_previous_text,
+                                                                   audio_ctx=args.audio_ctx, audio_ctx_bucket=args.audio_ctx_bucket)
+                sliding_window.pending_audio = None
+            else:
+                chunk = EncodedChunk(audio_model, audio_np, fp16=use_fp16, condition_on_previous_text=args.condition_on_previous_text,
+                                     audio_ctx=args.audio_ctx, audio_ctx_bucket=args.audio_ctx_bucket)
+
+            if ".en" in model:
+                detected_language = "English"
+            else:
+                if args.stream_language:
+                    print(f"Language Set: {args.stream_language}\n")
+                    detected_language = args.stream_language
                 else:
-                    mel = whisper.log_mel_spectrogram(audio, n_mels=80).to(device)
+                    print(f"Detecting Language\n")
+                    detected_language, language_probs = chunk.detect_language()
 
+            if args.language:
+                detected_language = args.language
+                if args.auto_language_lock:
+                    if args.no_log == False:
+                        print(f"Language locked to {detected_language}")
+                else:
+                    if args.no_log == False:
+                        print(f"Language set by argument: {detected_language}")
+            else:
                 if ".en" in model:
                     detected_language = "English"
+                    if args.no_log == False:
+                        print(f"Language set by model: {detected_language}")
                 else:
-                    if args.stream_language:
-                        print(f"Language Set: {args.stream_language}\n")
-                        detected_language = args.stream_language
-                    else:
-                        print(f"Detecting Language\n")
-                        _, language_probs = audio_model.detect_language(mel)
-                        detected_language = max(language_probs, key=language_probs.get)
-
-                if args.language:
-                    detected_language = args.language
                     if args.auto_language_lock:
-                        if args.no_log == False:
-                            print(f"Language locked to {detected_language}")
-                    else:
-                        if args.no_log == False:
-                            print(f"Language set by argument: {detected_language}")
-                else:
-                    if ".en" in model:
-                        detected_language = "English"
-                        if args.no_log == False:
-                            print(f"Language set by model: {detected_language}")
-                    else:
-                        if args.auto_language_lock:
-                            if last_detected_language == detected_language:
-                                english_counter += 1
-                                if english_counter >= 5:
-                                    if args.no_log == False:
-                                        print(f"Language locked to {detected_language}")
-                                    args.language = detected_language
-                            else:
-                                english_counter = 0
-                                last_detected_language = detected_language
-                        try:
-                            confidence = language_probs[detected_language] * 100
-                            confidence_color = Fore.GREEN if confidence > 75 else (Fore.YELLOW if confidence > 50 else Fore.RED)
-                            set_window_title(detected_language, confidence)
-                            if args.discord_webhook:
+                        if last_detected_language == detected_language:
+                            english_counter += 1
+                            if english_counter >= 5:
                                 if args.no_log == False:
-                                    print(f"Detected language: {detected_language} {confidence_color}({confidence:.2f}% Accuracy){Style.RESET_ALL}")
-                        except:
-                            pass
-
-                if args.transcribe:
-                    if args.no_log == False:
-                        print("Transcribing...")
+                                    print(f"Language locked to {detected_language}")
+                                args.language = detected_language
+                        else:
+                            english_counter = 0
+                            last_detected_language = detected_language
+                    try:
+                        confidence = language_probs[detected_language] * 100
+                        confidence_color = Fore.GREEN if confidence > 75 else (Fore.YELLOW if confidence > 50 else Fore.RED)
+                        set_window_title(detected_language, confidence)
+                        if args.discord_webhook:
+                            if args.no_log == False:
+                                print(f"Detected language: {detected_language} {confidence_color}({confidence:.2f}% Accuracy){Style.RESET_ALL}")
+                    except:
+                        pass
 
-                if device == "cuda":
-                    result = audio_model.transcribe(temp_file, fp16=args.fp16, language=detected_language, condition_on_previous_text=args.condition_on_previous_text)
-                else:
-                    result = audio_model.transcribe(temp_file, language=detected_language, condition_on_previous_text=args.condition_on_previous_text)
+            if args.audio_ctx_compare:
+                compare_audio_ctx(audio_model, audio_np, detected_language, fp16=use_fp16, audio_ctx_bucket=args.audio_ctx_bucket)
 
+            if args.transcribe:
                 if args.no_log == False:
-                    print(f"Detected Speech: {result['text']}")
+                    print("Transcribing...")
 
-                if result['text'] == "":
-                    if args.retry:
-                        if args.no_log == False:
-                            print("Transcription failed, trying again...")
-                        send_to_discord_webhook(webhook_url, "Transcription failed, trying again...")
-                        if device == "cuda":
-                            result = audio_model.transcribe(temp_file, fp16=args.fp16, language=detected_language, condition_on_previous_text=args.condition_on_previous_text)
-                        else:
-                            result = audio_model.transcribe(temp_file, language=detected_language, condition_on_previous_text=args.condition_on_previous_text)
-                        if args.no_log == False:
-                            print(f"Detected Speech: {result['text']}")
-                    else:
-                        if args.no_log == False:
-                            print("Transcription failed, skipping...")
-                if args.discord_webhook:
-                    send_to_discord_webhook(webhook_url, f"Detected Speech: {result['text']}")
-                text = result['text'].strip()
+            if sliding_window:
+                committed_audio = sliding_window.update(detected_language, chunk)
+                result = {"text": sliding_window.text}
+            else:
+                result = chunk.transcribe(language=detected_language)
 
-                if args.translate:
-                    if detected_language != 'en':
-                        if args.no_log == False:
-                            print("Translating...")
-                        if device == "cuda":
-                            translated_result = audio_model.transcribe(temp_file, fp16=args.fp16, task="translate", language=detected_language, condition_on_previous_text=args.condition_on_previous_text)
-                        else:
-                            translated_result = audio_model.transcribe(temp_file, task="translate", language=detected_language, condition_on_previous_text=args.condition_on_previous_text)
-                        translated_text = translated_result['text'].strip()
-                        if translated_text == "":
-                            if args.retry:
-                                if args.no_log == False:
-                                    print("Translation failed, trying again...")
-                                send_to_discord_webhook(webhook_url, "Translation failed, trying again...")
-                                if device == "cuda":
-                                    translated_result = audio_model.transcribe(temp_file, fp16=args.fp16, task="translate", language=detected_language, condition_on_previous_text=args.condition_on_previous_text)
-                                else:
-                                    translated_result = audio_model.transcribe(temp_file, task="translate", language=detected_language, condition_on_previous_text=args.condition_on_previous_text)
-                            translated_text = translated_result['text'].strip()
-                        if args.discord_webhook:
-                            if translated_text == "":
-                                send_to_discord_webhook(webhook_url, f"Translation failed")
-                            else:
-                                send_to_discord_webhook(webhook_url, f"Translated Speech: {translated_text}")
+            if args.no_log == False:
+                print(f"Detected Speech: {result['text']}")
 
-                    else:
-                        translated_text = ""
-                        new_header = f"{translated_text}"
-                        api_backend.update_translated_header(new_header)
-                        if args.discord_webhook:
-                            send_to_discord_webhook(webhook_url, "Translation failed")
+            if result['text'] == "" and not sliding_window:
+                if args.retry:
+                    if args.no_log == False:
+                        print("Transcription failed, trying again...")
+                    send_to_discord_webhook(webhook_url, "Transcription failed, trying again...")
+                    result = chunk.transcribe(language=detected_language, retry=True)
+                    if args.no_log == False:
+                        print(f"Detected Speech: {result['text']}")
+                else:
+                    if args.no_log == False:
+                        print("Transcription failed, skipping...")
+            if args.discord_webhook:
+                send_to_discord_webhook(webhook_url, f"Detected Speech: {result['text']}")
+            text = result['text'].strip()
 
-                if args.transcribe:
+            if args.translate:
+                if detected_language != 'en':
                     if args.no_log == False:
-                        print(f"Transcribing to {target_language}...")
-                    if device == "cuda":
-                        transcribed_result = audio_model.transcribe(temp_file, fp16=args.fp16, task="transcribe", language=target_language, condition_on_previous_text=args.condition_on_previous_text)
-                    else:
-                        transcribed_result = audio_model.transcribe(temp_file, task="transcribe", language=target_language, condition_on_previous_text=args.condition_on_previous_text)
-                    transcribed_text = transcribed_result['text'].strip()
-                    if transcribed_text == "":
+                        print("Translating...")
+                    translated_result = chunk.transcribe(task="translate", language=detected_language)
+                    translated_text = translated_result['text'].strip()
+                    if translated_text == "":
                         if args.retry:
                             if args.no_log == False:
-                                print("transcribe failed, trying again...")
-                            send_to_discord_webhook(webhook_url, "transcribe failed, trying again...")
-                            if device == "cuda":
-                                transcribed_result = audio_model.transcribe(temp_file, fp16=args.fp16, task="transcribe", language=target_language, condition_on_previous_text=args.condition_on_previous_text)
-                            else:
-                                transcribed_result = audio_model.transcribe(temp_file, task="transcribe", language=target_language, condition_on_previous_text=args.condition_on_previous_text)
-                        transcribed_text = transcribed_result['text'].strip()
+                                print("Translation failed, trying again...")
+                            send_to_discord_webhook(webhook_url, "Translation failed, trying again...")
+                            translated_result = chunk.transcribe(task="translate", language=detected_language, retry=True)
+                        translated_text = translated_result['text'].strip()
                     if args.discord_webhook:
-                        if transcribed_text == "":
+                        if translated_text == "":
                             send_to_discord_webhook(webhook_url, f"Translation failed")
                         else:
-                            send_to_discord_webhook(webhook_url, f"transcribed Speech: {transcribed_text}")
+                            send_to_discord_webhook(webhook_url, f"Translated Speech: {translated_text}")
 
                 else:
-                    transcribed_text = ""
+                    translated_text = ""
+                    new_header = f"{translated_text}"
+                    api_backend.update_translated_header(new_header)
                     if args.discord_webhook:
-                        send_to_discord_webhook(webhook_url, "transcribe failed")
-                
+                        send_to_discord_webhook(webhook_url, "Translation failed")
+
+            if args.transcribe:
+                if args.no_log == False:
+                    print(f"Transcribing to {target_language}...")
+                transcribed_result = chunk.transcribe(task="transcribe", language=target_language)
+                transcribed_text = transcribed_result['text'].strip()
+                if transcribed_text == "":
+                    if args.retry:
+                        if args.no_log == False:
+                            print("transcribe failed, trying again...")
+                        send_to_discord_webhook(webhook_url, "transcribe failed, trying again...")
+                        transcribed_result = chunk.transcribe(task="transcribe", language=target_language, retry=True)
+                    transcribed_text = transcribed_result['text'].strip()
                 if args.discord_webhook:
-                    message = "----------------"
-                    send_to_discord_webhook(webhook_url, message)
+                    if transcribed_text == "":
+                        send_to_discord_webhook(webhook_url, f"Translation failed")
+                    else:
+                        send_to_discord_webhook(webhook_url, f"transcribed Speech: {transcribed_text}")
 
-                if phrase_complete:
-                    transcription.append((text, translated_text if args.translate else None, transcribed_text if args.transcribe else None, detected_language))
-                else:
-                    transcription[-1] = (text, translated_text if args.translate else None, transcribed_text if args.transcribe else None, detected_language)
+            else:
+                transcribed_text = ""
+                if args.discord_webhook:
+                    send_to_discord_webhook(webhook_url, "transcribe failed")
+
+            if sliding_window:
+                # The tail outputs only cover uncommitted audio, so put the committed part in front of them.
+                # The other tasks run once on the audio committed on the previous tick, which this tick's
+                # tail no longer covers, and the audio committed now is kept for the next tick's batch.
+                translate_tail = args.translate and detected_language != 'en'
+                if committed_chunk:
+                    if translate_tail:
+                        sliding_window.commit_text("translation", committed_chunk.transcribe(task="translate", language=detected_language)["text"])
+                    if args.transcribe:
+                        sliding_window.commit_text("transcription", committed_chunk.transcribe(task="transcribe", language=target_language)["text"])
+                if translate_tail:
+                    translated_text = sliding_window.join_text("translation", translated_text)
+                if args.transcribe:
+                    transcribed_text = sliding_window.join_text("transcription", transcribed_text)
+                if committed_audio is not None and (translate_tail or args.transcribe):
+                    sliding_window.pending_audio = committed_audio
+
+            if args.discord_webhook:
+                message = "----------------"
+                send_to_discord_webhook(webhook_url, message)
+
+            if phrase_complete:
+                transcription.append((text, translated_text if args.translate else None, transcribed_text if args.transcribe else None, detected_language))
+                if not args.save_transcript:
+                    # Only the current phrase is used, the history is kept by the web server's bounded caption store.
+                    del transcription[:-1]
+            else:
+                transcription[-1] = (text, translated_text if args.translate else None, transcribed_text if args.transcribe else None, detected_language)
+
+            if args.portnumber:
+                # Headers and history entry both come from this tick's text, the phrase being spoken
+                # stays one history entry until it is complete.
+                api_backend.publish_phrase(ignore_filter.filter(text),
+                                           ignore_filter.filter(translated_text) if args.translate and translated_text else "",
+                                           ignore_filter.filter(transcribed_text) if args.transcribe and transcribed_text else "",
+                                           detected_language, revise_last=not phrase_complete)
 
-                if args.portnumber:
-                    try:
-                        # Filter original_text for the header
-                        filtered_header_text = original_text.lower()
-                        for phrase in blacklist:
-                            filtered_header_text = re.sub(rf"\b{phrase.lower()}\b", "", filtered_header_text).strip()
-
-                        #if filtered_header_text:
-                            #new_header = f"({detected_language}) {filtered_header_text}"
-                        new_header = f"{filtered_header_text}"
-                        api_backend.update_header(new_header)
-                    except:
-                        pass
-                    try:
-                        # Filter translated_text for the header
-                        filtered_translated_text = translated_text.lower()
-                        for phrase in blacklist:
-                            filtered_translated_text = re.sub(rf"\b{phrase.lower()}\b", "",
-                                                              filtered_translated_text).strip()
-                        #if filtered_translated_text:
-                        new_header = f"{filtered_translated_text}"
-                        api_backend.update_translated_header(new_header)
-                    except:
-                        pass
-                    try:
-                        # Filter transcribed_text for the header
-                        filtered_transcribed_text = transcribed_text.lower()
-                        for phrase in blacklist:
-                            filtered_transcribed_text = re.sub(rf"\b{phrase.lower()}\b", "",
-                                                               filtered_transcribed_text).strip()
-                        #if filtered_transcribed_text:
-                        new_header = f"{filtered_transcribed_text}"
-                        api_backend.update_transcribed_header(new_header)
-                    except:
-                        pass
 
+            #os.system('cls' if os.name=='nt' else 'clear')
 
-                #os.system('cls' if os.name=='nt' else 'clear')
+            if not args.no_log:
+                # Only print the last element of the transcription (the new segment)
+                original_text, translated_text, transcribed_text, detected_language = transcription[-1]
 
-                if not args.no_log:
-                    # Only print the last element of the transcription (the new segment)
-                    original_text, translated_text, transcribed_text, detected_language = transcription[-1]
+                # Filter text based on blacklist using regex
+                filtered_text = ignore_filter.filter(original_text)
 
-                    # Filter text based on blacklist using regex
-                    filtered_text = original_text.lower()
-                    for phrase in blacklist:
-                        filtered_text = re.sub(rf"\b{phrase.lower()}\b", "", filtered_text).strip()
+                if not filtered_text:  # Check if filtered_text is empty
+                    continue
 
-                    if not filtered_text:  # Check if filtered_text is empty
-                        continue
+                print("=" * shutil.get_terminal_size().columns)
+                print(
+                    f"{' ' * int((shutil.get_terminal_size().columns - 15) / 2)} What was Heard -> {detected_language} {' ' * int((shutil.get_terminal_size().columns - 15) / 2)}")
+                print(f"{filtered_text}")  # Use filtered_text here
+                new_header = filtered_text
+                if args.portnumber:
+                    api_backend.update_header(new_header)
+
+                if args.translate and translated_text:
+                    # Filter translated_text as well
+                    filtered_translated_text = ignore_filter.filter(translated_text)
 
-                    print("=" * shutil.get_terminal_size().columns)
                     print(
-                        f"{' ' * int((shutil.get_terminal_size().columns - 15) / 2)} What was Heard -> {detected_language} {' ' * int((shutil.get_terminal_size().columns - 15) / 2)}")
-                    print(f"{filtered_text}")  # Use filtered_text here
-                    new_header = filtered_text
-                    if args.portnumber:
-                        api_backend.update_header(new_header)
-
-                    if args.translate and translated_text:
-                        # Filter translated_text as well
-                        filtered_translated_text = translated_text
-                        for phrase in blacklist:
-                            filtered_translated_text = re.sub(rf"\b{phrase.lower()}\b", "",
-                                                              filtered_translated_text).strip()
-
-                        print(
-                            f"{'-' * int((shutil.get_terminal_size().columns - 15) / 2)} EN Translation {'-' * int((shutil.get_terminal_size().columns - 15) / 2)}")
-                        print(f"{filtered_translated_text}\n")  # Use filtered_translated_text here
-
-                    if args.transcribe and transcribed_text:
-                        # Filter transcribed_text as well
-                        filtered_transcribed_text = transcribed_text
-                        for phrase in blacklist:
-                            filtered_transcribed_text = re.sub(rf"\b{phrase.lower()}\b", "",
-                                                               filtered_transcribed_text).strip()
-
-                        print(
-                            f"{'-' * int((shutil.get_terminal_size().columns - 15) / 2)} {detected_language} -> {target_language} {'-' * int((shutil.get_terminal_size().columns - 15) / 2)}")
-                        print(f"{filtered_transcribed_text}\n")  # Use filtered_transcribed_text here
+                        f"{'-' * int((shutil.get_terminal_size().columns - 15) / 2)} EN Translation {'-' * int((shutil.get_terminal_size().columns - 15) / 2)}")
+                    print(f"{filtered_translated_text}\n")  # Use filtered_translated_text here
 
-                else:
-                    # Only print the last translated or transcribed text
-                    original_text, translated_text, transcribed_text, detected_language = transcription[-1]
+                if args.transcribe and transcribed_text:
+                    # Filter transcribed_text as well
+                    filtered_transcribed_text = ignore_filter.filter(transcribed_text)
 
-                    if args.translate and translated_text:
-                        # Filter translated_text using regex
-                        filtered_translated_text = translated_text
-                        for phrase in blacklist:
-                            filtered_translated_text = re.sub(rf"\b{phrase.lower()}\b", "",
-                                                              filtered_translated_text).strip()
+                    print(
+                        f"{'-' * int((shutil.get_terminal_size().columns - 15) / 2)} {detected_language} -> {target_language} {'-' * int((shutil.get_terminal_size().columns - 15) / 2)}")
+                    print(f"{filtered_transcribed_text}\n")  # Use filtered_transcribed_text here
 
-                        print(f"{filtered_translated_text}")  # Use filtered_translated_text here
+            else:
+                # Only print the last translated or transcribed text
+                original_text, translated_text, transcribed_text, detected_language = transcription[-1]
 
-                    if args.transcribe and transcribed_text:
-                        # Filter transcribed_text using regex
-                        filtered_transcribed_text = transcribed_text
-                        for phrase in blacklist:
-                            filtered_transcribed_text = re.sub(rf"\b{phrase.lower()}\b", "",
-                                                               filtered_transcribed_text).strip()
+                if args.translate and translated_text:
+                    # Filter translated_text using regex
+                    filtered_translated_text = ignore_filter.filter(translated_text)
 
-                        print(f"{filtered_transcribed_text}")  # Use filtered_transcribed_text here
+                    print(f"{filtered_translated_text}")  # Use filtered_translated_text here
 
+                if args.transcribe and transcribed_text:
+                    # Filter transcribed_text using regex
+                    filtered_transcribed_text = ignore_filter.filter(transcribed_text)
 
-                print('', end='', flush=True)
+                    print(f"{filtered_transcribed_text}")  # Use filtered_transcribed_text here
 
-                if args.auto_model_swap:
-                    if last_detected_language != detected_language:
-                        last_detected_language = detected_language
-                        language_counters[detected_language] = 1
-                    else:
-                        language_counters[detected_language] += 1
-
-                    if language_counters[detected_language] == 5:
-                        if detected_language == 'en' and model != 'base':
-                            print("Detected English 5 times in a row, changing model to base.")
-                            model = 'base'
-                            audio_model = whisper.load_model(model, device=device)
-                            print("Model was changed to base since English was detected 5 times in a row.")
-                        elif detected_language != 'en' and model != 'large':
-                            print(f"Detected {detected_language} 5 times in a row, changing model to large.")
-                            model = 'large'
-                            audio_model = whisper.load_model(model, device=device)
-                            print(f"Model was changed to large since {detected_language} was detected 5 times in a row.")
-        # sleep for 1 second
-            sleep(1)
+
+            print('', end='', flush=True)
+
+            if args.auto_model_swap:
+                swap_model = 'base' if detected_language == 'en' else 'large'
+                if last_detected_language != detected_language:
+                    last_detected_language = detected_language
+                    language_counters[detected_language] = 1
+                    # Start loading the model this language would swap to, so the swap itself is instant.
+                    model_pool.preload(swap_model)
+                else:
+                    language_counters[detected_language] += 1
+
+                if language_counters[detected_language] == 5 and model != swap_model:
+                    print(f"Detected {detected_language} 5 times in a row, changing model to {swap_model} once it is loaded.")
+                    model_pool.switch_to(swap_model)
         
         except Exception as e:
             if not isinstance(e, KeyboardInterrupt):
@@ -846,8 +912,11 @@ def main():
         except KeyboardInterrupt:
             print("Exiting...")
             # kill stream_thread
-            if args.stream:
+            if stream_mode:
                 stop_transcription()
+                if worker_pool:
+                    print(worker_pool.report())
+                    worker_pool.stop()
                 # clear temp folder of files that do not start with "rec_"
                 try:
                     for file in os.listdir(temp_dir):
@@ -857,6 +926,9 @@ def main():
                     pass
 
 
+            if vad:
+                print(vad.report())
+
             if args.discord_webhook:
                 send_to_discord_webhook(webhook_url, "**Service has stopped.**")
             # break
@@ -890,4 +962,6 @@ def main():
             sys.exit(0)
             
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Needed by the frozen (PyInstaller) build, whose worker processes are spawned from the executable.
+    multiprocessing.freeze_support()
+    main()